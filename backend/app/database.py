@@ -1,28 +1,112 @@
 import certifi
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient, ReadPreference
 import os
 from dotenv import load_dotenv
+from .pool_stats import PoolStats
 
 load_dotenv()
 
 # Database URL from Env
-MONGO_URL = os.getenv("MANGO_DB_URL") 
+MONGO_URL = os.getenv("MANGO_DB_URL")
+DB_NAME = "AutomatedAgreementDB"
 ca = certifi.where()
 
-# Create MongoDB Client with timeout and SSL/TLS settings using certifi
-client = MongoClient(
-    MONGO_URL,
-    serverSelectionTimeoutMS=5000,
-    connectTimeoutMS=10000,
-    tls=True,
-    tlsCAFile=ca
-)
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
 
-db = client.AutomatedAgreementDB
+
+def pool_settings():
+    """
+    Pool options from the environment. Size MONGO_MAX_POOL_SIZE for the requests one
+    worker process serves at once; every worker process has its own pools.
+    """
+    settings = {
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+    }
+    if os.getenv("MONGO_MAX_IDLE_TIME_MS"):
+        settings["maxIdleTimeMS"] = int(os.getenv("MONGO_MAX_IDLE_TIME_MS"))
+    if os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS"):
+        settings["waitQueueTimeoutMS"] = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS"))
+    return settings
+
+
+# Read-only endpoints may read from secondaries, e.g. MONGO_READ_PREFERENCE=secondaryPreferred
+READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+if READ_PREFERENCE not in READ_PREFERENCES:
+    raise ValueError(f"MONGO_READ_PREFERENCE must be one of {', '.join(READ_PREFERENCES)}")
+
+sync_pool_stats = PoolStats("sync")
+async_pool_stats = PoolStats("async")
+
+# Clients are created per process by connect() (app startup, or the CLI scripts),
+# never at import time, so a forking server doesn't share sockets between workers
+client = None
+db = None
+read_db = None
+async_client = None
+async_db = None
+async_read_db = None
+
+
+def client_options(listener):
+    return {
+        "serverSelectionTimeoutMS": 5000,
+        "connectTimeoutMS": 10000,
+        "tls": True,
+        "tlsCAFile": ca,
+        "event_listeners": [listener],
+        **pool_settings()
+    }
+
+
+def connect():
+    """Creates this process's clients (idempotent) and returns the sync database."""
+    global client, db, read_db, async_client, async_db, async_read_db
+    if client is None:
+        client = MongoClient(MONGO_URL, **client_options(sync_pool_stats))
+        db = client[DB_NAME]
+        read_db = client.get_database(DB_NAME, read_preference=READ_PREFERENCES[READ_PREFERENCE])
+    if async_client is None:
+        # Non-blocking client for `async def` routes: waiting on Mongo doesn't hold a threadpool thread
+        async_client = AsyncMongoClient(MONGO_URL, **client_options(async_pool_stats))
+        async_db = async_client[DB_NAME]
+        async_read_db = async_client.get_database(DB_NAME, read_preference=READ_PREFERENCES[READ_PREFERENCE])
+    return db
+
+
+async def close():
+    global client, db, read_db, async_client, async_db, async_read_db
+    if async_client is not None:
+        await async_client.close()
+    if client is not None:
+        client.close()
+    client = db = read_db = async_client = async_db = async_read_db = None
+
+
+def pool_stats():
+    return {
+        "settings": {**pool_settings(), "readPreference": READ_PREFERENCE},
+        "pools": [sync_pool_stats.snapshot(), async_pool_stats.snapshot()]
+    }
 
 # Dependency
 def get_db():
     try:
         yield db
     finally:
-        pass 
+        pass
+
+def get_read_db():
+    yield read_db
+
+async def get_async_db():
+    yield async_db
+
+async def get_async_read_db():
+    yield async_read_db
@@ -2,8 +2,14 @@ from fastapi import FastAPI, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
-from .routes import employee, letter, email, upload
+from fastapi.encoders import jsonable_encoder
+from .routes import employee, letter, email, upload, jobs, assets
 from . import database
+from .services.index_service import index_manager
+from .services.outbox_service import email_outbox
+from .services.job_service import job_runner
+from .services.ai_service import ai_engine
+from .services.process_pool import process_pool
 import os
 import logging
 
@@ -36,6 +42,66 @@ def health(db = Depends(database.get_db)):
         "database": db_status
     }
 
+@app.on_event("startup")
+def connect_database():
+    # Runs in each worker process, after any fork, before the other startup hooks
+    database.connect()
+
+@app.on_event("startup")
+def bootstrap_indexes():
+    try:
+        report = index_manager.ensure_indexes(database.db)
+        if report["created"]:
+            logger.info(f"Created indexes: {report['created']}")
+        for key, duplicates in report["duplicates"].items():
+            logger.warning(f"Unique index on {key} blocked by duplicates: {duplicates}")
+        for error in report["errors"]:
+            logger.error(f"Index creation failed: {error}")
+    except Exception as e:
+        logger.error(f"Index bootstrap skipped: {e}")
+
+@app.on_event("startup")
+def seed_letter_templates():
+    try:
+        ai_engine.templates.seed(database.db)
+    except Exception as e:
+        logger.error(f"Letter template seeding failed: {e}")
+
+@app.on_event("startup")
+def fail_stale_jobs():
+    try:
+        failed = job_runner.fail_stale_jobs(database.db)
+        if failed:
+            logger.warning(f"Marked {failed} stale bulk job(s) as failed")
+    except Exception as e:
+        logger.error(f"Stale job check skipped: {e}")
+
+@app.on_event("startup")
+def start_email_workers():
+    email_outbox.start(database.db)
+
+@app.on_event("shutdown")
+def stop_email_workers():
+    email_outbox.stop()
+
+@app.on_event("shutdown")
+def stop_process_pool():
+    process_pool.shutdown()
+
+@app.on_event("shutdown")
+async def close_database():
+    await database.close()
+
+@app.get("/debug/pool-stats")
+def connection_pool_stats():
+    """Connection pool usage and checkout waits for this worker process."""
+    return database.pool_stats()
+
+@app.get("/debug/query-plans")
+def query_plans(db = Depends(database.get_db)):
+    """Explains the hot queries so we can confirm none of them scan a whole collection."""
+    return index_manager.explain_queries(db)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -43,6 +109,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Include Routers
@@ -50,13 +117,16 @@ app.include_router(employee.router)
 app.include_router(letter.router)
 app.include_router(email.router)
 app.include_router(upload.router)
+app.include_router(jobs.router)
+app.include_router(assets.router)
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    logger.error(f"Validation Error: {exc.errors()}")
-    body = await request.body()
-    logger.error(f"Request Body: {body.decode()}")
+    # Drop the offending input values: they can be the whole (base64) PDF
+    errors = [{k: v for k, v in e.items() if k != "input"} for e in exc.errors()]
+    # The body isn't re-read: multipart routes have already consumed the stream
+    logger.error(f"Validation Error on {request.method} {request.url.path}: {errors}")
     return JSONResponse(
         status_code=422,
-        content={"detail": exc.errors(), "body": body.decode()},
+        content=jsonable_encoder({"detail": errors}),
     )
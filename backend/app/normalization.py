@@ -0,0 +1,68 @@
+from datetime import datetime
+from . import schemas
+import math
+
+STRING_FIELDS = ["designation", "department", "name", "emp_id", "location",
+                 "employment_type", "address", "replacement", "signature",
+                 "invoice_post_joining"]
+
+
+# Value in normalize_company's result for a field to remove ($unset)
+UNSET = object()
+
+
+def normalize_company(doc):
+    """
+    Returns the fields to $set (or UNSET) so a company document is in the current
+    Employee shape (same rules as sanitize_doc, but persisted once instead of on
+    every read).
+    """
+    updates = {}
+
+    # Email: no placeholders are stored, they would collide on the unique email index
+    # (which only covers documents that have one). Numbers (phones) are kept aside.
+    email = doc.get("email")
+    if email is not None and not isinstance(email, str):
+        if not (isinstance(email, float) and math.isnan(email)):
+            updates["legacy_email"] = email
+        updates["email"] = UNSET
+    elif "email" in doc and not email:
+        updates["email"] = UNSET
+
+    # String fields that might be NaN or non-string
+    for field in STRING_FIELDS:
+        val = doc.get(field)
+        if isinstance(val, float) and math.isnan(val):
+            updates[field] = None
+        elif val is not None and not isinstance(val, str):
+            updates[field] = str(val)
+
+    # Joining date: bulk imports stored "YYYY-MM-DD" strings
+    jd = doc.get("joining_date")
+    if isinstance(jd, str):
+        try:
+            updates["joining_date"] = datetime.strptime(jd.split(" ")[0], "%Y-%m-%d")
+        except ValueError:
+            updates["joining_date"] = None
+    elif isinstance(jd, float) and math.isnan(jd):
+        updates["joining_date"] = None
+
+    # Compensation: old HR format {ctc, basic_salary, ...} has no percentage; keep it aside
+    comp = doc.get("compensation")
+    if not isinstance(comp, dict):
+        updates["compensation"] = {"percentage": 0.0}
+    elif "percentage" not in comp:
+        updates["compensation"] = {"percentage": 0.0}
+        updates["legacy_compensation"] = comp
+    elif set(comp) != {"percentage"}:
+        updates["compensation"] = {"percentage": comp["percentage"]}
+
+    updates["schema_version"] = schemas.COMPANY_SCHEMA_VERSION
+    return updates
+
+
+def split_unset(updates):
+    """normalize_company() result -> ($set fields, $unset fields)."""
+    to_set = {k: v for k, v in updates.items() if v is not UNSET}
+    to_unset = {k: "" for k, v in updates.items() if v is UNSET}
+    return to_set, to_unset
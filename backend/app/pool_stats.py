@@ -0,0 +1,99 @@
+from pymongo import monitoring
+import threading
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters for one MongoClient, fed by pymongo's CMAP events.
+    `wait` is the time a request spent waiting to check a connection out; if it
+    grows, or checkouts fail with a timeout, the pool is too small for the
+    number of concurrent requests per worker.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.created = 0
+            self.closed = 0
+            self.checkouts = 0
+            self.checkout_failures = {}
+            self.wait_total = 0.0
+            self.wait_count = 0
+            self.wait_max = 0.0
+            self.pool_clears = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "client": self.name,
+                "open_connections": self.open,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "created": self.created,
+                "closed": self.closed,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "avg_wait_ms": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000, 3),
+                "pool_clears": self.pool_clears,
+            }
+
+    def _waited(self, event):
+        # ConnectionCheckedOut/CheckOutFailed carry `duration` (seconds) on pymongo >= 4.7
+        duration = getattr(event, "duration", None) or 0.0
+        self.wait_total += duration
+        self.wait_count += 1
+        self.wait_max = max(self.wait_max, duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self._waited(event)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            reason = str(event.reason)
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+            self._waited(event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(self.open - 1, 0)
+            self.closed += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    # Events we don't count
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
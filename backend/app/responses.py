@@ -0,0 +1,116 @@
+from fastapi.responses import StreamingResponse, FileResponse, Response
+import orjson
+import zipfile
+import io
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _default(value):
+    # ObjectId and anything else orjson doesn't know natively
+    return str(value)
+
+
+class ORJSONResponse(Response):
+    """JSON via orjson: NaN from legacy documents becomes null instead of failing."""
+    media_type = "application/json"
+
+    def render(self, content):
+        return orjson.dumps(content, default=_default)
+
+
+class ORJSONStreamingResponse(StreamingResponse):
+    """
+    Streams an iterable of dicts as one JSON array, encoding with orjson as the
+    items arrive instead of building the whole list (and its JSON) in memory.
+    """
+    media_type = "application/json"
+
+    def __init__(self, items, batch_size=200, **kwargs):
+        # Async cursors (the async Mongo client) are consumed on the event loop
+        encode = self._aencode if hasattr(items, "__aiter__") else self._encode
+        super().__init__(encode(items, batch_size), **kwargs)
+
+    @staticmethod
+    def _encode(items, batch_size):
+        yield b"["
+        batch = []
+        first = True
+        for item in items:
+            batch.append(orjson.dumps(item, default=_default))
+            if len(batch) >= batch_size:
+                yield (b"" if first else b",") + b",".join(batch)
+                first = False
+                batch = []
+        if batch:
+            yield (b"" if first else b",") + b",".join(batch)
+        yield b"]"
+
+    @staticmethod
+    async def _aencode(items, batch_size):
+        yield b"["
+        batch = []
+        first = True
+        async for item in items:
+            batch.append(orjson.dumps(item, default=_default))
+            if len(batch) >= batch_size:
+                yield (b"" if first else b",") + b",".join(batch)
+                first = False
+                batch = []
+        if batch:
+            yield (b"" if first else b",") + b",".join(batch)
+        yield b"]"
+
+
+def immutable_file_response(request, path, etag, media_type=None):
+    """
+    Serves a content-addressed file: a strong ETag from its hash, a year-long
+    immutable Cache-Control, 304 on a matching If-None-Match, and Range / If-Range
+    handled by FileResponse.
+    """
+    etag = f'"{etag}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file that collects what ZipFile writes until drained."""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ZipStreamingResponse(StreamingResponse):
+    """
+    Streams a ZIP built from an iterable of (name, bytes, compress) entries. Each
+    entry is sent as soon as it is written; ZipFile uses data descriptors on an
+    unseekable sink, so the archive is never held in memory.
+    """
+    media_type = "application/zip"
+
+    def __init__(self, entries, filename="archive.zip", **kwargs):
+        headers = {"Content-Disposition": f"attachment; filename={filename}", **kwargs.pop("headers", {})}
+        super().__init__(self._encode(entries), headers=headers, **kwargs)
+
+    @staticmethod
+    def _encode(entries):
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, "w") as zf:
+            for name, data, compress in entries:
+                zf.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED)
+                yield sink.drain()
+        yield sink.drain() # central directory
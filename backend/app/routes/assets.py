@@ -0,0 +1,63 @@
+from fastapi import APIRouter, HTTPException, Request
+from ..responses import immutable_file_response
+from pathlib import Path
+import hashlib
+import re
+
+router = APIRouter(
+    prefix="/assets",
+    tags=["Assets"]
+)
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
+PUBLIC_DIR = BASE_DIR / "public"
+ASSET_DIR = PUBLIC_DIR / "assets"
+
+# <name>.<first 16 hex chars of sha256>.<ext>, e.g. My_Letterhead.599ae35c56d3fbe2.pdf
+ASSET_NAME = re.compile(r"^[\w.-]+\.([0-9a-f]{16})\.(pdf|jpg|jpeg|png)$")
+MEDIA_TYPES = {"pdf": "application/pdf", "jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png"}
+# Uploads are named by what they are, whatever extension the client's filename had
+CONTENT_EXTENSIONS = {"application/pdf": "pdf", "image/jpeg": "jpg", "image/png": "png"}
+
+
+def asset_name(filename, contents, content_type=None):
+    """
+    Content-addressed name for an upload; the same bytes always get the same name.
+    Only names GET /assets/{name} can serve are produced: other characters in the
+    stem become "_", and file types it can't serve raise ValueError.
+    """
+    stem, dot, ext = Path(filename or "").name.rpartition(".")
+    if not dot:
+        stem, ext = ext, ""
+    ext = CONTENT_EXTENSIONS.get(content_type) or ext.lower()
+    if ext not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported file type '{ext or content_type or 'unknown'}'; upload a PDF, JPG or PNG")
+    stem = re.sub(r"[^\w.-]+", "_", stem).strip("._") or "template"
+    digest = hashlib.sha256(contents).hexdigest()[:16]
+    return f"{stem}.{digest}.{ext}"
+
+
+def is_servable(url):
+    """False for /assets/ URLs stored before names were cleaned up (they 404)."""
+    return not url.startswith("/assets/") or bool(ASSET_NAME.match(url[len("/assets/"):]))
+
+
+def store_asset(filename, contents, content_type=None):
+    """Writes an upload under its hashed name (once) and returns its path."""
+    name = asset_name(filename, contents, content_type)
+    ASSET_DIR.mkdir(parents=True, exist_ok=True)
+    path = ASSET_DIR / name
+    if not path.exists():
+        partial = path.with_name(path.name + ".part")
+        partial.write_bytes(contents)
+        partial.replace(path)
+    return path
+
+
+@router.get("/{name}")
+def get_asset(name: str, request: Request):
+    match = ASSET_NAME.match(name)
+    path = ASSET_DIR / name
+    if not match or not path.exists():
+        raise HTTPException(status_code=404, detail="Asset not found")
+    return immutable_file_response(request, path, match.group(1), MEDIA_TYPES[match.group(2)])
@@ -1,15 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, File, Form, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from .. import database
-from ..services.email_service import email_client
+from ..services.outbox_service import email_outbox
 from bson import ObjectId
+from datetime import datetime
 
 router = APIRouter(
     prefix="/email",
     tags=["email"]
 )
 
-from typing import Optional
+from typing import Optional, List
 import base64
 
 class EmailRequest(BaseModel):
@@ -20,6 +22,12 @@ class EmailRequest(BaseModel):
     company_name: Optional[str] = "Arah Infotech Pvt Ltd"
     subject: Optional[str] = None
 
+class BatchEmailRequest(BaseModel):
+    employee_ids: List[str]
+    message: str # may use {{ params.name }}
+    subject: Optional[str] = "Message from {{ params.name }}"
+    company_name: Optional[str] = "Arah Infotech Pvt Ltd"
+
 @router.post("/send")
 def send_offer_email(request: EmailRequest, db = Depends(database.get_db)):
     if not ObjectId.is_valid(request.employee_id):
@@ -38,8 +46,10 @@ def send_offer_email(request: EmailRequest, db = Depends(database.get_db)):
             request.pdf_base64 = request.pdf_base64.split("base64,")[1]
         pdf_bytes = base64.b64decode(request.pdf_base64)
 
-    # 2. Send Email (Backend Process)
-    result = email_client.send_offer_letter(
+    # 2. Queue for delivery; outbox workers send it and mark the status on success
+    outbox_id = email_outbox.enqueue(
+        db,
+        employee_id=request.employee_id,
         recipient_email=employee.get("email"),
         candidate_name=employee.get("name"),
         letter_content=request.letter_content,
@@ -48,12 +58,97 @@ def send_offer_email(request: EmailRequest, db = Depends(database.get_db)):
         subject=request.subject, 
         company_name=request.company_name
     )
-    
-    # 3. Update Status if Sent
-    if result.get("status") == "success":
-        db.companies.update_one(
-            {"_id": ObjectId(request.employee_id)},
-            {"$set": {"status": "Agreement Sent"}}
-        )
-    
-    return result
+
+    return {"status": "queued", "message": "Email queued for delivery", "outbox_id": str(outbox_id)}
+
+@router.post("/send-file")
+async def send_offer_email_file(
+    employee_id: str = Form(...),
+    pdf: Optional[UploadFile] = File(None),
+    letter_content: Optional[str] = Form(None),
+    custom_message: Optional[str] = Form(None),
+    subject: Optional[str] = Form(None),
+    company_name: Optional[str] = Form("Arah Infotech Pvt Ltd"),
+    db = Depends(database.get_db)
+):
+    """
+    Same as /email/send, but the PDF arrives as a binary multipart part
+    instead of a base64 data URI inside JSON (no 33% inflation, no decode pass).
+    """
+    if not ObjectId.is_valid(employee_id):
+        raise HTTPException(status_code=400, detail="Invalid ObjectId")
+
+    # Sync driver calls go to the threadpool so they don't block the event loop
+    employee = await run_in_threadpool(db.companies.find_one, {"_id": ObjectId(employee_id)}, {"email": 1, "name": 1})
+    if not employee:
+        raise HTTPException(status_code=404, detail="Employee not found")
+
+    # Starlette has already spooled the part to a temp file; this is the single in-memory copy
+    pdf_bytes = await pdf.read() if pdf is not None else None
+
+    outbox_id = await run_in_threadpool(
+        email_outbox.enqueue,
+        db,
+        employee_id=employee_id,
+        recipient_email=employee.get("email"),
+        candidate_name=employee.get("name"),
+        letter_content=letter_content,
+        pdf_content=pdf_bytes or None,
+        email_body=custom_message,
+        subject=subject,
+        company_name=company_name
+    )
+
+    return {"status": "queued", "message": "Email queued for delivery", "outbox_id": str(outbox_id)}
+
+@router.get("/outbox/{message_id}")
+def read_outbox_message(message_id: str, db = Depends(database.get_db)):
+    message = email_outbox.get(db, message_id)
+    if message is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    message["id"] = str(message.pop("_id"))
+    message["employee_id"] = str(message["employee_id"])
+    return message
+
+@router.post("/outbox/{message_id}/retry")
+def retry_outbox_message(message_id: str, db = Depends(database.get_db)):
+    """Re-queue a dead-lettered message."""
+    if not ObjectId.is_valid(message_id):
+        raise HTTPException(status_code=400, detail="Invalid ObjectId")
+    result = db.email_outbox.update_one(
+        {"_id": ObjectId(message_id), "status": "dead"},
+        {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": datetime.utcnow()}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=404, detail="No dead-lettered message with that id")
+    return {"status": "queued"}
+
+@router.post("/send-batch")
+def send_batch_email(request: BatchEmailRequest, db = Depends(database.get_db)):
+    """
+    Queues the same message (no attachment) for many companies. On Brevo the outbox
+    sends one API call per 1000 recipients instead of one per recipient; follow
+    each recipient's delivery via GET /email/outbox/{outbox_id}.
+    """
+    ids = [ObjectId(i) for i in request.employee_ids if ObjectId.is_valid(i)]
+    companies = {
+        str(doc["_id"]): doc
+        for doc in db.companies.find({"_id": {"$in": ids}}, {"email": 1, "name": 1})
+    }
+
+    recipients = []
+    results = {}
+    for employee_id in request.employee_ids:
+        company = companies.get(employee_id)
+        if not company:
+            results[employee_id] = {"status": "error", "message": "Employee not found"}
+        elif not company.get("email"):
+            results[employee_id] = {"status": "error", "message": "No email address"}
+        else:
+            recipients.append({"employee_id": employee_id, "email": company["email"], "name": company.get("name")})
+
+    outbox_ids = email_outbox.enqueue_batch(db, recipients, request.subject, request.message, company_name=request.company_name)
+    for recipient, outbox_id in zip(recipients, outbox_ids):
+        results[recipient["employee_id"]] = {"status": "queued", "outbox_id": str(outbox_id)}
+
+    return [{"employee_id": employee_id, **results[employee_id]} for employee_id in request.employee_ids]
@@ -1,11 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Response
 from fastapi.responses import StreamingResponse
-from typing import List
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
 from .. import database, schemas
+from ..responses import ORJSONResponse, ORJSONStreamingResponse
+from ..services.import_service import company_importer
+from ..services.job_service import job_runner
+from ..services.sequence_service import emp_id_sequence
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, date
 import pandas as pd
+import tempfile
 import io
+import os
+import re
+import math
 
 router = APIRouter(
     prefix="/employees",
@@ -19,8 +30,6 @@ def fix_id(doc):
         doc.pop("_id", None)         # remove raw ObjectId to avoid serialization issues
     return doc
 
-import math
-
 def sanitize_doc(doc):
     """Fix corrupted documents from old imports so they pass Pydantic validation."""
     if not doc:
@@ -53,6 +62,31 @@ def sanitize_doc(doc):
     
     return doc
 
+def is_current(doc):
+    return doc.get("schema_version", 0) >= schemas.COMPANY_SCHEMA_VERSION
+
+def clean_doc(doc):
+    """Sanitize only legacy documents; migrated ones are already in shape."""
+    if is_current(doc):
+        return fix_id(doc)
+    return sanitize_doc(fix_id(doc))
+
+# Response fields and their defaults, as Employee would fill them in
+EMPLOYEE_DEFAULTS = {name: field.default for name, field in schemas.Employee.model_fields.items()}
+
+def serialize_company(doc):
+    """
+    Fast path for list responses: normalized documents are mapped straight to the
+    response shape; only legacy ones go through sanitize_doc + Pydantic.
+    """
+    if is_current(doc):
+        out = {name: doc.get(name, default) for name, default in EMPLOYEE_DEFAULTS.items()}
+        out["id"] = str(doc["_id"])
+        if isinstance(out["joining_date"], datetime):
+            out["joining_date"] = out["joining_date"].date()
+        return out
+    return schemas.Employee.model_validate(sanitize_doc(fix_id(doc))).model_dump(mode="json")
+
 @router.post("/", response_model=schemas.Employee)
 def create_employee(employee: schemas.EmployeeCreate, db = Depends(database.get_db)):
     # Check if email exists
@@ -71,12 +105,13 @@ def create_employee(employee: schemas.EmployeeCreate, db = Depends(database.get_
     
     # Auto-generate emp_id if missing
     if not emp_data.get('emp_id'):
-        count = db.companies.count_documents({})
-        emp_data['emp_id'] = f"EMP{count + 1:03d}" 
+        emp_data['emp_id'] = emp_id_sequence.next_emp_id(db)
 
     # Construct Document
     new_employee_doc = {
         **emp_data,
+        "schema_version": schemas.COMPANY_SCHEMA_VERSION,
+        "revision": 1,
         "status": "Pending",
         "created_at": datetime.utcnow(),
         "compensation": {
@@ -84,17 +119,93 @@ def create_employee(employee: schemas.EmployeeCreate, db = Depends(database.get_
         }
     }
     
-    # Insert
-    result = db.companies.insert_one(new_employee_doc)
+    # Insert (unique indexes on email/emp_id catch races with a concurrent create)
+    try:
+        result = db.companies.insert_one(new_employee_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email or Partner ID already registered")
     new_employee_doc["_id"] = result.inserted_id
     
     return fix_id(new_employee_doc)
 
+def build_company_filter(status=None, name_prefix=None, min_percentage=None, max_percentage=None, q=None):
+    """Server-side filters for the company list; each one is backed by an index."""
+    query = {}
+    if status:
+        query["status"] = status
+    if name_prefix:
+        # Anchored, case-sensitive prefix so the name index can be used
+        query["name"] = {"$regex": f"^{re.escape(name_prefix)}"}
+    if min_percentage is not None or max_percentage is not None:
+        query["compensation.percentage"] = {}
+        if min_percentage is not None:
+            query["compensation.percentage"]["$gte"] = min_percentage
+        if max_percentage is not None:
+            query["compensation.percentage"]["$lte"] = max_percentage
+    if q:
+        query["$text"] = {"$search": q}
+    return query
+
 @router.get("/", response_model=List[schemas.Employee])
-def read_employees(skip: int = 0, limit: int = 100, db = Depends(database.get_db)):
-    cursor = db.companies.find().skip(skip).limit(limit)
-    employees = [sanitize_doc(fix_id(doc)) for doc in cursor]
-    return employees
+async def read_employees(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    min_percentage: Optional[float] = None,
+    max_percentage: Optional[float] = None,
+    q: Optional[str] = None,
+    fast: bool = False,
+    db = Depends(database.get_async_read_db)
+):
+    """
+    Lists companies a page at a time, ordered by _id (i.e. creation time).
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page;
+    `fields` is a comma-separated projection, e.g. `fields=name,email,status`.
+    `fast=true` streams the array with orjson and skips re-validating normalized documents.
+    """
+    query = build_company_filter(status, name_prefix, min_percentage, max_percentage, q)
+
+    # Keyset pagination: continue after the last _id of the previous page
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$gt" if order == "asc" else "$lt": ObjectId(cursor)}
+
+    projection = None
+    if fields:
+        projection = {f.strip(): 1 for f in fields.split(",") if f.strip() and f.strip() not in ("id", "_id")}
+
+    cursor = (
+        db.companies.find(query, projection)
+        .sort("_id", ASCENDING if order == "asc" else DESCENDING)
+        .skip(skip)
+        .limit(limit)
+    )
+
+    if fast:
+        # Streamed straight from the cursor; the next cursor is the id of the last item
+        if projection is not None:
+            return ORJSONStreamingResponse(fix_id(doc) async for doc in cursor)
+        return ORJSONStreamingResponse(serialize_company(doc) async for doc in cursor)
+
+    docs = await cursor.to_list(length=limit)
+
+    next_cursor = str(docs[-1]["_id"]) if len(docs) == limit else None
+
+    if projection is not None:
+        # Only the requested fields: skip sanitizing/defaults so nothing extra is sent;
+        # orjson writes NaN left in unmigrated documents as null
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return ORJSONResponse(content=[fix_id(doc) for doc in docs], headers=headers)
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [clean_doc(doc) for doc in docs]
 
 @router.get("/template")
 def download_template():
@@ -120,15 +231,15 @@ def download_template():
     )
 
 @router.get("/{employee_id}", response_model=schemas.Employee)
-def read_employee(employee_id: str, db = Depends(database.get_db)):
+async def read_employee(employee_id: str, db = Depends(database.get_async_read_db)):
     if not ObjectId.is_valid(employee_id):
         raise HTTPException(status_code=400, detail="Invalid ObjectId")
         
-    employee = db.companies.find_one({"_id": ObjectId(employee_id)})
+    employee = await db.companies.find_one({"_id": ObjectId(employee_id)})
     if employee is None:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    return fix_id(employee)
+    return clean_doc(employee)
 
 @router.delete("/{employee_id}", status_code=204)
 def delete_employee(employee_id: str, db = Depends(database.get_db)):
@@ -144,14 +255,10 @@ def delete_employee(employee_id: str, db = Depends(database.get_db)):
     return
 
 @router.put("/{employee_id}", response_model=schemas.Employee)
-def update_employee(employee_id: str, employee_update: schemas.EmployeeCreate, db = Depends(database.get_db)):
+async def update_employee(employee_id: str, employee_update: schemas.EmployeeCreate, db = Depends(database.get_async_db)):
     if not ObjectId.is_valid(employee_id):
         raise HTTPException(status_code=400, detail=f"Invalid ObjectId: '{employee_id}'")
 
-    existing = db.companies.find_one({"_id": ObjectId(employee_id)})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Employee not found")
-
     update_data = employee_update.dict()
     new_percentage = update_data.pop('percentage', None)
 
@@ -166,14 +273,21 @@ def update_employee(employee_id: str, employee_update: schemas.EmployeeCreate, d
         update_data["compensation"] = {
             "percentage": new_percentage
         }
+
+    # Every field is rewritten from the validated request, so the document is now normalized
+    update_data["schema_version"] = schemas.COMPANY_SCHEMA_VERSION
     
-    # Perform Update
-    db.companies.update_one(
-        {"_id": ObjectId(employee_id)},
-        {"$set": update_data}
-    )
-    
-    updated_doc = db.companies.find_one({"_id": ObjectId(employee_id)})
+    # Perform Update (one round trip: a missing company comes back as None)
+    try:
+        updated_doc = await db.companies.find_one_and_update(
+            {"_id": ObjectId(employee_id)},
+            {"$set": update_data, "$inc": {"revision": 1}}, # cached letters key on the revision
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email or Partner ID already registered")
+    if not updated_doc:
+        raise HTTPException(status_code=404, detail="Employee not found")
     return fix_id(updated_doc)
 
 @router.post("/upload")
@@ -190,95 +304,48 @@ async def upload_employees_bulk(file: UploadFile = File(...), db = Depends(datab
         else:
             raise HTTPException(status_code=400, detail="Invalid file format")
         
-        # Normalize Headers
-        df.columns = [str(c).lower().strip().replace(' ', '_') for c in df.columns]
-        
-        def find_col(aliases):
-            for alias in aliases:
-                if alias in df.columns: return alias
-            return None
-
-        success_count = 0
-        errors = []
-
-        for index, row in df.iterrows():
-            try:
-                # 1. Email
-                col_email = find_col(['email', 'email_id', 'email_address'])
-                email = row.get(col_email)
-                if pd.isna(email) or not email:
-                    errors.append(f"Row {index+2}: Email missing")
-                    continue
-                
-                if db.companies.find_one({"email": email}):
-                    errors.append(f"Skipped {email}: Exists")
-                    continue
-
-                # 2. Basic Fields
-                col_name = find_col(['name', 'full_name'])
-                name = row.get(col_name, "Unknown")
-                
-                col_desg = find_col(['designation', 'role'])
-                desg = row.get(col_desg, "TBD")
-                
-                col_dept = find_col(['department'])
-                dept = row.get(col_dept, "General")
-
-                # 3. Joining Date
-                col_date = find_col(['joining_date', 'doj'])
-                jd = row.get(col_date)
-                try:
-                    j_date = pd.to_datetime(jd).strftime("%Y-%m-%d") if not pd.isna(jd) else datetime.now().strftime("%Y-%m-%d")
-                except:
-                    j_date = datetime.now().strftime("%Y-%m-%d")
-
-                # 4. ID
-                col_id = find_col(['emp_id'])
-                emp_id = row.get(col_id)
-                if pd.isna(emp_id) or not emp_id:
-                    count = db.companies.count_documents({})
-                    emp_id = f"EMP{count + 1 + success_count:03d}" 
-
-                # 5. CTC & Compensation
-                col_ctc = find_col(['ctc', 'annual_ctc'])
-                ctc_val = row.get(col_ctc, 0)
-                ctc = float(ctc_val) if not pd.isna(ctc_val) else 0
-
-                basic = ctc * 0.5
-                hra = basic * 0.5
-                pf = basic * 0.12
-                pt = 2400
-                special = ctc - (basic + hra + pf)
-                if special < 0: special = 0
-
-                doc = {
-                    "emp_id": str(emp_id),
-                    "name": name,
-                    "email": email,
-                    "designation": desg,
-                    "department": dept,
-                    "joining_date": j_date, # storing as string for simplicity in bulk, or convert to datetime
-                    "location": row.get('location', 'Remote'),
-                    "employment_type": row.get('employment_type', 'Full Time'),
-                    "status": "Pending",
-                    "created_at": datetime.utcnow(),
-                    "compensation": {
-                        "ctc": ctc,
-                        "basic_salary": round(basic, 2),
-                        "hra": round(hra, 2),
-                        "allowances": round(special, 2),
-                        "deductions": round(pf + pt, 2),
-                        "net_salary": ctc
-                    }
-                }
-                
-                db.companies.insert_one(doc)
-                success_count += 1
-
-            except Exception as e:
-                errors.append(f"Row {index+2}: {str(e)}")
-        
+        # Normalize Headers & resolve column aliases once for the whole sheet
+        company_importer.normalize_headers(df)
+        success_count, errors = company_importer.import_frame(db, df)
+
         return {"status": "success", "imported_count": success_count, "errors": errors}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/upload/stream", response_model=schemas.JobCreated, status_code=202)
+async def upload_employees_stream(file: UploadFile = File(...), db = Depends(database.get_db)):
+    """
+    Streaming Bulk Upload for very large sheets.
+    The upload is spooled to disk and imported chunk by chunk in a background job;
+    poll GET /jobs/{job_id} for progress and row-level errors.
+    """
+    if file.filename.endswith('.xlsx'):
+        file_format = "xlsx"
+    elif file.filename.endswith('.csv'):
+        file_format = "csv"
+    else:
+        raise HTTPException(status_code=400, detail="Invalid file format")
+
+    # 1. Spool to disk without holding the whole file in memory
+    spool = tempfile.NamedTemporaryFile(suffix=f".{file_format}", delete=False)
+    try:
+        while chunk := await file.read(1024 * 1024):
+            await run_in_threadpool(spool.write, chunk)
+    finally:
+        spool.close()
+
+    # 2. Import in the background (the job bookkeeping is blocking pymongo, so off the event loop)
+    job = await run_in_threadpool(job_runner.create_job, db, "company_import", [], params={"filename": file.filename})
+
+    def task(job_id):
+        def on_progress(processed, imported, errors):
+            job_runner.record_progress(db, job_id, processed=processed, succeeded=imported,
+                                       failed=processed - imported, errors=errors)
+        try:
+            company_importer.import_file(db, spool.name, file_format, on_progress)
+        finally:
+            os.remove(spool.name)
+
+    await run_in_threadpool(job_runner.run_task, db, job, task)
+    return {"job_id": str(job["_id"]), "status": "running", "total": 0}
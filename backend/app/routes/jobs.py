@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, HTTPException
+from .. import database
+from ..services.job_service import job_runner
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"]
+)
+
+@router.get("/{job_id}")
+def read_job(job_id: str, db = Depends(database.get_db)):
+    job = job_runner.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job["id"] = str(job.pop("_id"))
+    return job
@@ -1,35 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, Query, Header
 from fastapi.responses import Response
 from .. import database, schemas
-from ..services.ai_service import ai_engine
+from ..services.ai_service import ai_engine, normalize_letter_type
+from ..services.outbox_service import email_outbox
+from ..services.job_service import job_runner
+from ..services.pdf_service import pdf_renderer, TemplateNotFoundError
+from ..services.letter_cache import letter_cache
+from ..services.docx_service import docx_exporter
+from ..services.export_service import letter_exporter, EXPORT_FORMATS
+from ..responses import ZipStreamingResponse
 from bson import ObjectId
+from jinja2 import TemplateSyntaxError, TemplateError
+from typing import List, Optional
+from pymongo import DESCENDING
 from datetime import datetime, date
 import tempfile
-import io
-from htmldocx import HtmlToDocx
-from docx import Document
+import hmac
+import os
+import re
 
 router = APIRouter(
     prefix="/letters",
     tags=["letters"]
 )
 
-@router.post("/generate", response_model=schemas.LetterResponse)
-def generate_letter(request: schemas.LetterRequest, db = Depends(database.get_db)):
-    if not ObjectId.is_valid(request.employee_id):
-        raise HTTPException(status_code=400, detail="Invalid ObjectId")
-
-    # 1. Fetch Employee Data
-    employee = db.companies.find_one({"_id": ObjectId(request.employee_id)})
-    if not employee:
-        raise HTTPException(status_code=404, detail="Employee not found")
-    
-    # 2. Fetch Payroll Data (From Embedded Compensation)
+def build_letter_context(employee, company_name):
+    # Payroll Data lives in the Embedded Compensation
     comp = employee.get("compensation", {})
-    
+
     data_context = {
         "name": employee.get("name"),
-        "company_name": request.company_name,
+        "company_name": company_name,
         "percentage": comp.get("percentage", 0.0),
         "address": employee.get("address", ""),
         "joining_date": employee.get("joining_date", date.today().strftime('%Y-%m-%d')),
@@ -37,43 +38,367 @@ def generate_letter(request: schemas.LetterRequest, db = Depends(database.get_db
         "invoice_post_joining": employee.get("invoice_post_joining", 45),
         "signature": employee.get("signature", "Authorized Signatory")
     }
-    
+
     # Add Current Date for the Letter Header
     data_context["current_date"] = date.today().strftime('%Y-%m-%d')
+    return data_context
 
-    # 4. Call AI Service
-    generated_text = ai_engine.generate_letter(data_context, request.letter_type)
-    
-    # 5. Save History
-    new_letter = {
-        "employee_id": ObjectId(request.employee_id), # Link to employee
+def history_record(employee, letter_type, context, template, etag):
+    """
+    History keeps the render context and the template version, not the ~12 KB of
+    HTML; letter_content() rebuilds the letter when it is opened.
+    """
+    return {
+        "employee_id": employee["_id"], # Link to employee
         "emp_id": employee.get("emp_id"), # Store human readable ID too
-        "letter_type": request.letter_type,
-        "content": generated_text,
+        "letter_type": letter_type,
+        "context": context,
+        "template_type": template.letter_type,
+        "template_version": template.version,
         "file_path": None,
+        "etag": etag,
         "generated_on": datetime.utcnow()
     }
-    db.generated_agreements.insert_one(new_letter)
 
+def letter_content(db, record):
+    if "content" in record: # recorded before history was compacted
+        return record["content"]
+    template = ai_engine.templates.get_version(db, record["template_type"], record["template_version"])
+    return ai_engine.render(template, record["context"])
+
+def letter_key(employee, letter_type, company_name, template):
+    """
+    Everything a rendered letter depends on; see LetterCache. The template is
+    identified by its own type and version: a letter type without a body of its
+    own renders the agreement's, and its first own body is version 1 as well.
+    """
+    return (str(employee["_id"]), employee.get("revision", 0), normalize_letter_type(letter_type),
+            company_name, template.letter_type, template.version, date.today().isoformat())
+
+def render_cached(employee, letter_type, company_name, template):
+    """
+    Renders the letter for an already-fetched company, or reuses the cached rendering
+    of the same revision. Returns (content, etag, context); context is None when the
+    letter came from the cache (and so is already in the history).
+    """
+    key = letter_key(employee, letter_type, company_name, template)
+    etag = letter_cache.etag(key)
+    content = letter_cache.get(key)
+    if content is not None:
+        return content, etag, None
+    context = build_letter_context(employee, company_name)
+    content = ai_engine.render(template, context)
+    letter_cache.put(key, content)
+    return content, etag, context
+
+def history_upsert(employee, letter_type, context, template, etag):
+    # Upsert on the etag: another worker may already have recorded this rendering
+    return (
+        {"employee_id": employee["_id"], "etag": etag},
+        {"$setOnInsert": history_record(employee, letter_type, context, template, etag)}
+    )
+
+def generate_and_store(db, employee, letter_type, company_name):
+    """
+    Renders (or reuses) the letter and records each distinct rendering in the
+    history once. Returns (content, etag).
+    """
+    template = ai_engine.templates.get(db, letter_type)
+    content, etag, context = render_cached(employee, letter_type, company_name, template)
+    if context is not None:
+        db.generated_agreements.update_one(*history_upsert(employee, letter_type, context, template, etag), upsert=True)
+    return content, etag
+
+async def generate_and_store_async(db, employee, letter_type, company_name):
+    """generate_and_store() for the async Mongo client."""
+    template = await ai_engine.templates.get_async(db, letter_type)
+    content, etag, context = render_cached(employee, letter_type, company_name, template)
+    if context is not None:
+        await db.generated_agreements.update_one(*history_upsert(employee, letter_type, context, template, etag), upsert=True)
+    return content, etag
+
+@router.post("/generate", response_model=schemas.LetterResponse)
+async def generate_letter(request: schemas.LetterRequest, http_request: Request, response: Response, db = Depends(database.get_async_db)):
+    if not ObjectId.is_valid(request.employee_id):
+        raise HTTPException(status_code=400, detail="Invalid ObjectId")
+
+    # 1. Fetch Employee Data
+    employee = await db.companies.find_one({"_id": ObjectId(request.employee_id)})
+    if not employee:
+        raise HTTPException(status_code=404, detail="Employee not found")
+
+    # 2. Unchanged company, template and issuer: the client's copy is current
+    template = await ai_engine.templates.get_async(db, request.letter_type)
+    etag = f'"{letter_cache.etag(letter_key(employee, request.letter_type, request.company_name, template))}"'
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # 3. Generate & Save History
+    generated_text, _ = await generate_and_store_async(db, employee, request.letter_type, request.company_name)
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
     return {"content": generated_text, "file_path": None}
 
+def generate_many(db, employee_ids, letter_type, company_name):
+    """
+    Letters for many companies: one $in fetch, one render pass and one insert_many
+    into the history (only for renderings not recorded before). Results are in
+    `employee_ids` order, with an error instead of content for ids that are invalid
+    or not found.
+    """
+    object_ids = [ObjectId(i) for i in set(employee_ids) if ObjectId.is_valid(i)]
+    employees = {str(e["_id"]): e for e in db.companies.find({"_id": {"$in": object_ids}})}
+
+    # Rendering is a compiled-template pass (tens of microseconds per letter), so a
+    # single loop beats fanning out; each distinct company is rendered once and
+    # unchanged ones come from the letter cache.
+    template = ai_engine.templates.get(db, letter_type)
+    rendered = {}
+    fresh = {} # employee_id -> (etag, context), rendered by this call
+    for employee_id, employee in employees.items():
+        try:
+            content, etag, context = render_cached(employee, letter_type, company_name, template)
+            if context is not None:
+                fresh[employee_id] = (etag, context)
+            rendered[employee_id] = content
+        except Exception as e:
+            rendered[employee_id] = e
+
+    results = []
+    for employee_id in employee_ids:
+        if not ObjectId.is_valid(employee_id):
+            results.append({"employee_id": employee_id, "status": "error", "error": "Invalid ObjectId"})
+        elif employee_id not in employees:
+            results.append({"employee_id": employee_id, "status": "error", "error": "Employee not found"})
+        elif isinstance(rendered[employee_id], Exception):
+            results.append({"employee_id": employee_id, "status": "error", "error": str(rendered[employee_id])})
+        else:
+            results.append({"employee_id": employee_id, "status": "success", "content": rendered[employee_id],
+                            "name": employees[employee_id].get("name")})
+
+    # One history row per distinct rendering, skipping ones another worker already recorded
+    if fresh:
+        etags = [etag for etag, _ in fresh.values()]
+        recorded = {d["etag"] for d in db.generated_agreements.find({"etag": {"$in": etags}}, {"etag": 1})}
+        history = [
+            history_record(employees[employee_id], letter_type, context, template, etag)
+            for employee_id, (etag, context) in fresh.items() if etag not in recorded
+        ]
+        if history:
+            db.generated_agreements.insert_many(history, ordered=False)
+
+    return results
+
+def export_filename(result, extension, used):
+    """'Acme Corp' -> 'Acme_Corp.docx', suffixed with the id if two companies share a name."""
+    stem = re.sub(r"[^\w.-]+", "_", result.get("name") or "").strip("_") or result["employee_id"]
+    if stem in used:
+        stem = f"{stem}_{result['employee_id']}"
+    used.add(stem)
+    return f"{stem}.{extension}"
+
+@router.post("/generate-batch", response_model=schemas.BatchLetterResponse)
+def generate_letter_batch(request: schemas.BatchLetterRequest, db = Depends(database.get_db)):
+    """
+    Generates letters for many companies in one call; see generate_many.
+    """
+    results = generate_many(db, request.employee_ids, request.letter_type, request.company_name)
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
+@router.post("/export")
+def export_letters(request: schemas.ExportRequest, db = Depends(database.get_db)):
+    """
+    Agreements for a selection of companies as a streamed ZIP of PDF, DOCX or HTML
+    files. Files are produced concurrently and written to the archive as each one
+    finishes; failures are listed in errors.txt at the end.
+    """
+    file_format = request.format.lower()
+    extension, compressed = EXPORT_FORMATS[file_format]
+    # Checked up front: once streaming starts the status can't change, and every PDF would fail
+    if file_format == "pdf" and request.template and pdf_renderer.resolve_template(request.template) is None:
+        raise HTTPException(status_code=400, detail=f"Letterhead template '{request.template}' not found")
+    results = generate_many(db, list(dict.fromkeys(request.employee_ids)), request.letter_type, request.company_name)
+    letters = {r["employee_id"]: r for r in results if r["status"] == "success"}
+    errors = [f"{r['employee_id']}: {r['error']}" for r in results if r["status"] == "error"]
+
+    def entries():
+        used = set()
+        files = letter_exporter.iter_files(
+            ((employee_id, r.get("name") or employee_id, r["content"]) for employee_id, r in letters.items()),
+            file_format, request.template
+        )
+        for employee_id, data in files:
+            if isinstance(data, Exception):
+                errors.append(f"{employee_id}: {data}")
+                continue
+            yield export_filename(letters[employee_id], extension, used), data, not compressed
+        if errors:
+            yield "errors.txt", "\n".join(errors).encode("utf-8"), True
+
+    return ZipStreamingResponse(entries(), filename=f"Agreements_{file_format}.zip")
+
+@router.post("/docx-bulk")
+def download_docx_bulk(request: schemas.BatchLetterRequest, db = Depends(database.get_db)):
+    """
+    DOCX agreements for many companies as one ZIP: POST /letters/export with format=docx.
+    """
+    export = schemas.ExportRequest(employee_ids=request.employee_ids, format="docx",
+                                   letter_type=request.letter_type, company_name=request.company_name)
+    return export_letters(export, db)
+
+@router.post("/bulk", response_model=schemas.JobCreated, status_code=202)
+def bulk_send_letters(request: schemas.BulkLetterRequest, db = Depends(database.get_db)):
+    """
+    Generate -> render -> queue the email for many companies on the server.
+    Returns immediately; poll GET /jobs/{job_id} for progress and per-company results.
+    Emails are delivered by the outbox, which marks each company "Agreement Sent".
+    """
+    ids = list(dict.fromkeys(request.employee_ids)) # drop duplicate selections, keep order
+    job = job_runner.create_job(db, "bulk_letters", ids, params={
+        "template": request.template,
+        "letter_type": request.letter_type,
+        "company_name": request.company_name
+    })
+
+    def process(employee_id):
+        if not ObjectId.is_valid(employee_id):
+            raise ValueError("Invalid ObjectId")
+
+        employee = db.companies.find_one({"_id": ObjectId(employee_id)})
+        if not employee:
+            raise ValueError("Employee not found")
+        if not employee.get("email"):
+            raise ValueError("No email address")
+
+        name = employee.get("name") or "Partner"
+        content, _ = generate_and_store(db, employee, request.letter_type, request.company_name)
+        pdf_bytes = pdf_renderer.render_agreement(content, request.template)
+
+        # Delivery (rate limiting, retries, status update) is the outbox's job
+        outbox_id = email_outbox.enqueue(
+            db,
+            employee_id=employee_id,
+            recipient_email=employee.get("email"),
+            candidate_name=name,
+            letter_content=content,
+            pdf_content=pdf_bytes,
+            email_body=request.custom_message or (
+                f"Dear {name},\n\nWe are pleased to align on an agreement with {request.company_name}.\n\n"
+                f"Please find your agreement document attached.\n\nRegards,\nTeam"
+            ),
+            subject=request.subject or f"Agreement - {name}",
+            company_name=request.company_name
+        )
+        return f"Queued for delivery (outbox {outbox_id})"
+
+    job_runner.submit(db, job, process)
+    return {"job_id": str(job["_id"]), "status": job["status"], "total": job["total"]}
+
+@router.post("/pdf")
+def render_letter_pdf(request: schemas.PdfRequest):
+    """
+    Renders agreement HTML onto a letterhead as a text PDF, without a browser.
+    """
+    try:
+        pdf_bytes = pdf_renderer.render_agreement(request.html_content, request.template)
+    except TemplateNotFoundError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(
+        content=pdf_bytes,
+        media_type="application/pdf",
+        headers={"Content-Disposition": "attachment; filename=Agreement.pdf"}
+    )
+
+HISTORY_FIELDS = {"employee_id": 1, "emp_id": 1, "letter_type": 1, "template_version": 1, "generated_on": 1}
+
+def history_item(record):
+    return {
+        "id": str(record["_id"]),
+        "employee_id": str(record["employee_id"]),
+        "emp_id": record.get("emp_id"),
+        "letter_type": record.get("letter_type"),
+        "template_version": record.get("template_version"),
+        "generated_on": record.get("generated_on")
+    }
+
+@router.get("/history", response_model=List[schemas.LetterHistoryItem])
+def list_letter_history(
+    response: Response,
+    employee_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db = Depends(database.get_read_db)
+):
+    """
+    Generated letters, newest first, metadata only. Pass the X-Next-Cursor response
+    header back as `cursor` for the next page; open one via /letters/history/{id}.
+    """
+    query = {}
+    if employee_id:
+        if not ObjectId.is_valid(employee_id):
+            raise HTTPException(status_code=400, detail="Invalid ObjectId")
+        query["employee_id"] = ObjectId(employee_id)
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$lt": ObjectId(cursor)}
+
+    docs = list(db.generated_agreements.find(query, HISTORY_FIELDS).sort("_id", DESCENDING).limit(limit))
+    if len(docs) == limit:
+        response.headers["X-Next-Cursor"] = str(docs[-1]["_id"])
+    return [history_item(doc) for doc in docs]
+
+@router.get("/history/{history_id}", response_model=schemas.LetterHistoryDetail)
+def read_letter_history(history_id: str, db = Depends(database.get_read_db)):
+    if not ObjectId.is_valid(history_id):
+        raise HTTPException(status_code=400, detail="Invalid ObjectId")
+    record = db.generated_agreements.find_one({"_id": ObjectId(history_id)})
+    if not record:
+        raise HTTPException(status_code=404, detail="Letter not found")
+    return {**history_item(record), "content": letter_content(db, record)}
+
+@router.get("/templates", response_model=List[schemas.LetterTemplateOut])
+def list_letter_templates(db = Depends(database.get_db)):
+    return [
+        {"letter_type": t["_id"], "template_body": t["template_body"], "version": t["version"], "updated_at": t.get("updated_at")}
+        for t in db.letter_templates.find().sort("_id", 1)
+    ]
+
+def require_template_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Editing letter bodies needs the X-Admin-Token header to match TEMPLATE_ADMIN_TOKEN;
+    without that variable set, editing over the API is disabled.
+    """
+    expected = os.getenv("TEMPLATE_ADMIN_TOKEN", "")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Template editing is disabled (TEMPLATE_ADMIN_TOKEN not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@router.put("/templates/{letter_type}", response_model=schemas.LetterTemplateOut,
+            dependencies=[Depends(require_template_admin)])
+def save_letter_template(letter_type: str, request: schemas.LetterTemplateIn, db = Depends(database.get_db)):
+    """
+    Creates or replaces the body (Jinja2) for a letter type; generation picks up the
+    new version without a restart. The body is test-rendered with placeholder values
+    first, so unknown variables or sandbox violations are rejected here.
+    """
+    try:
+        version = ai_engine.templates.save(db, letter_type, request.template_body,
+                                           sample_context=ai_engine.build_context({}))
+    except TemplateSyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Template error on line {e.lineno}: {e.message}")
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=f"Template error: {e.message}")
+    return {"letter_type": normalize_letter_type(letter_type), "template_body": request.template_body, "version": version}
+
 @router.post("/download-docx")
 def download_docx(html_content: str = Body(..., embed=True)):
-    # Convert HTML to DOCX
-    document = Document()
-    new_parser = HtmlToDocx()
-    
-    # Simple strip out <html>, <body> if present
-    content_to_parse = html_content
-    # The HtmlToDocx library handles standard HTML fairly well
-    new_parser.add_html_to_document(content_to_parse, document)
-    
-    doc_io = io.BytesIO()
-    document.save(doc_io)
-    doc_io.seek(0)
-    
+    # Built from the agreement's own structure and cached by content hash
     return Response(
-        content=doc_io.read(),
+        content=docx_exporter.render(html_content),
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         headers={"Content-Disposition": "attachment; filename=Agreement.docx"}
     )
@@ -1,5 +1,11 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request
-import shutil
+from fastapi import APIRouter, File, UploadFile, HTTPException, Request, Depends, Response
+from fastapi.concurrency import run_in_threadpool
+from ..responses import immutable_file_response
+from .. import database
+from datetime import datetime
+import hashlib
+import re
+import json
 import os
 from pathlib import Path
 
@@ -14,7 +20,54 @@ router = APIRouter(
 BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
 PUBLIC_DIR = BASE_DIR / "public"
 
-import fitz # PyMuPDF
+from ..services.pdf_service import pdf_renderer
+from ..services.preview_service import template_previews, PREVIEW_SIZES
+from .assets import store_asset, is_servable
+
+# url -> stored metadata, so the layout endpoint doesn't hit Mongo on every render
+_layout_cache = {}
+
+def save_template_metadata(db, template_url, path):
+    pdf_renderer.templates.invalidate(path)
+    content_hash = pdf_renderer.templates.content_hash(path)
+    layout = pdf_renderer.analyze_layout(path)
+    metadata = {
+        "filename": Path(path).resolve().relative_to(PUBLIC_DIR.resolve()).as_posix(),
+        "content_hash": content_hash,
+        "layout": layout,
+        "analyzed_at": datetime.utcnow()
+    }
+    db.template_metadata.update_one({"_id": template_url}, {"$set": metadata}, upsert=True)
+    _layout_cache[template_url] = {"_id": template_url, **metadata}
+    return layout
+
+@router.get("/template-layout")
+def get_template_layout(url: str, request: Request, db = Depends(database.get_db)):
+    """
+    Page box, header/footer extents and free content rectangle of a letterhead,
+    e.g. /upload/template-layout?url=/Arah_Template.pdf
+    """
+    metadata = _layout_cache.get(url)
+    if metadata is None:
+        metadata = db.template_metadata.find_one({"_id": url})
+        if metadata is None:
+            # Templates that predate metadata extraction are analyzed on first request
+            path = pdf_renderer.resolve_template(url)
+            if path is None:
+                raise HTTPException(status_code=404, detail="Template not found")
+            save_template_metadata(db, url, path)
+            metadata = _layout_cache[url]
+        _layout_cache[url] = metadata
+
+    etag = f'"{metadata["content_hash"]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=json.dumps({"url": url, "content_hash": metadata["content_hash"], **metadata["layout"]}),
+        media_type="application/json",
+        headers=headers
+    )
 
 @router.post("/template-image")
 async def upload_template_image(request: Request, file: UploadFile = File(...)):
@@ -30,23 +83,33 @@ async def upload_template_image(request: Request, file: UploadFile = File(...)):
         if not os.path.exists(PUBLIC_DIR):
              raise HTTPException(status_code=500, detail=f"Public directory not found at {PUBLIC_DIR}")
 
-        file_path = PUBLIC_DIR / file.filename
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
+        contents = await file.read()
+        try:
+            file_path = await run_in_threadpool(store_asset, file.filename, contents, file.content_type)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
         base_url = str(request.base_url).rstrip("/")
-        return {"filename": file.filename, "path": str(file_path), "status": "success", "url": f"{base_url}/{file.filename}"}
+        return {
+            "filename": file_path.name,
+            "path": str(file_path),
+            "status": "success",
+            "url": f"/assets/{file_path.name}",
+            "asset_url": f"{base_url}/assets/{file_path.name}"
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/template-pdf")
-async def upload_template_pdf(request: Request, file: UploadFile = File(...)):
+async def upload_template_pdf(request: Request, file: UploadFile = File(...), db = Depends(database.get_db)):
     """
     Uploads a PDF template:
-    1. Saves the original PDF to public folder (for pdf-lib to use)
-    2. Converts first page to JPG as fallback
+    1. Saves the original PDF to public folder (for pdf-lib to use), unless the
+       same content was uploaded before
+    2. Measures its layout; JPG previews are rendered on demand
     3. Returns the URL as root-relative path for frontend
     """
     try:
@@ -56,34 +119,64 @@ async def upload_template_pdf(request: Request, file: UploadFile = File(...)):
         if not os.path.exists(PUBLIC_DIR):
              raise HTTPException(status_code=500, detail=f"Public directory not found at {PUBLIC_DIR}")
 
-        # Sanitize filename
-        safe_name = file.filename.replace(" ", "_")
-        
-        # 1. Save original PDF to public folder (frontend can fetch it directly)
-        pdf_path = PUBLIC_DIR / safe_name
         contents = await file.read()
-        with open(pdf_path, "wb") as buffer:
-            buffer.write(contents)
-            
-        # 2. Also convert first page to JPG as fallback
-        doc = fitz.open(pdf_path)
-        page = doc.load_page(0)
-        pix = page.get_pixmap(dpi=300)
-        
-        image_filename = f"{safe_name}.jpg"
-        image_path = PUBLIC_DIR / image_filename
-        pix.save(image_path)
-        doc.close()
-        
-        # 3. Return root-relative URL (Vite serves /public/ as /)
+        content_hash = hashlib.sha256(contents).hexdigest()
+        base_url = str(request.base_url).rstrip("/")
+
+        # 1. Same bytes uploaded before (under any name): reuse that template as is
+        existing = await run_in_threadpool(db.template_metadata.find_one, {"content_hash": content_hash})
+        if existing and is_servable(existing["_id"]) and (PUBLIC_DIR / existing["filename"]).exists():
+            return template_response(existing["_id"], existing["filename"], content_hash, existing["layout"], base_url)
+
+        # Stored under a content-hashed name in public/assets, never overwritten
+        pdf_path = await run_in_threadpool(store_asset, file.filename, contents, file.content_type)
+        template_url = f"/assets/{pdf_path.name}"
+
+        # 2. Measure the letterhead once and keep it as template metadata
+        layout = await run_in_threadpool(save_template_metadata, db, template_url, pdf_path)
+
+        # 3. Return root-relative URL (also under Vite's /public/); the API serves
+        # the same file with immutable caching at asset_url.
         # Use the original PDF so pdf-lib can extract all pages
-        return {
-            "filename": safe_name, 
-            "url": f"/{safe_name}",  # Root-relative for frontend
-            "image_url": f"/{image_filename}",
-            "status": "success"
-        }
+        return template_response(template_url, pdf_path.name, content_hash, layout, base_url)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing template: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+def template_response(url, filename, content_hash, layout, base_url):
+    previews = {size: f"{base_url}/upload/template-preview/{content_hash}/{size}" for size in PREVIEW_SIZES}
+    return {
+        "filename": Path(filename).name,
+        "url": url,  # Root-relative for frontend
+        "asset_url": f"{base_url}{url}" if url.startswith("/assets/") else None,
+        "image_url": previews["print"],
+        "previews": previews,
+        "content_hash": content_hash,
+        "layout": layout,
+        "status": "success"
+    }
+
+@router.get("/template-preview/{content_hash}/{size}")
+async def get_template_preview(content_hash: str, size: str, request: Request, db = Depends(database.get_db)):
+    """
+    First page of an uploaded template as JPG (thumbnail, screen or print),
+    rendered on first request and served from disk afterwards.
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}", content_hash):
+        raise HTTPException(status_code=404, detail="Template not found")
+    if size not in PREVIEW_SIZES:
+        raise HTTPException(status_code=400, detail=f"Size must be one of: {', '.join(PREVIEW_SIZES)}")
+
+    target = template_previews.path_for(content_hash, size)
+    if not target.exists():
+        metadata = await run_in_threadpool(db.template_metadata.find_one, {"content_hash": content_hash})
+        source = PUBLIC_DIR / metadata["filename"] if metadata else None
+        if source is None or not source.exists():
+            raise HTTPException(status_code=404, detail="Template not found")
+        target = await template_previews.get(source, content_hash, size)
+
+    # The URL includes the content hash, so the bytes behind it never change
+    return immutable_file_response(request, target, f"{content_hash}_{size}", "image/jpeg")
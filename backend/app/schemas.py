@@ -1,10 +1,14 @@
 from pydantic import BaseModel, Field, BeforeValidator, EmailStr
-from datetime import date
+from datetime import date, datetime
 from typing import Optional, List, Annotated
 
 # Helper for MongoDB ObjectId
 PyObjectId = Annotated[str, BeforeValidator(str)]
 
+# Company documents stamped with this `schema_version` are already in the
+# Employee shape below and can be served without sanitizing/re-validation.
+COMPANY_SCHEMA_VERSION = 1
+
 # Employee Schemas
 class EmployeeBase(BaseModel):
     emp_id: Optional[str] = None
@@ -78,6 +82,66 @@ class EmailRequest(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+class BulkLetterRequest(BaseModel):
+    employee_ids: List[str]
+    template: Optional[str] = "/Arah_Template.pdf"
+    letter_type: Optional[str] = "Agreement"
+    company_name: Optional[str] = "Arah Infotech Pvt Ltd"
+    custom_message: Optional[str] = None
+    subject: Optional[str] = None
+
+class PdfRequest(BaseModel):
+    html_content: str
+    template: Optional[str] = "/Arah_Template.pdf"
+
+class JobCreated(BaseModel):
+    job_id: str
+    status: str
+    total: int
+
 class LetterResponse(BaseModel):
     content: str
     file_path: Optional[str] = None
+
+class BatchLetterRequest(BaseModel):
+    employee_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    letter_type: str = "Agreement"
+    company_name: Optional[str] = "Arah Infotech Pvt Ltd"
+
+class ExportRequest(BaseModel):
+    employee_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    format: str = Field("pdf", pattern="^(?i:pdf|docx|html)$")
+    template: Optional[str] = "/Arah_Template.pdf"
+    letter_type: str = "Agreement"
+    company_name: Optional[str] = "Arah Infotech Pvt Ltd"
+
+class BatchLetterResult(BaseModel):
+    employee_id: str
+    status: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchLetterResponse(BaseModel):
+    results: List[BatchLetterResult]
+    succeeded: int
+    failed: int
+
+class LetterHistoryItem(BaseModel):
+    id: str
+    employee_id: str
+    emp_id: Optional[str] = None
+    letter_type: Optional[str] = None
+    template_version: Optional[int] = None
+    generated_on: Optional[datetime] = None
+
+class LetterHistoryDetail(LetterHistoryItem):
+    content: str
+
+class LetterTemplateIn(BaseModel):
+    template_body: str
+
+class LetterTemplateOut(BaseModel):
+    letter_type: str
+    template_body: str
+    version: int
+    updated_at: Optional[datetime] = None
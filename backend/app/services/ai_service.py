@@ -1,46 +1,261 @@
-import requests
-import json
+from datetime import datetime
+from pathlib import Path
+from jinja2 import StrictUndefined
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+from pymongo import ReturnDocument
+import threading
+import time
+import re
+import os
+
+# Bundled letter bodies, seeded into the `letter_templates` collection on startup
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "letter_templates"
+DEFAULT_LETTER_TYPE = "agreement"
+
+# Company registered office addresses
+COMPANY_ADDRESSES = {
+    'Arah Infotech Pvt Ltd': 'Ground Floor, Shanmukh Emmpire, Ayyappa Society, Main Road, Madhapur, Hyderabad, Telangana - 500081',
+    'VAGARIOUS SOLUTIONS PVT LTD': 'Plot No. 1208, Flat No. 201, 2nd Floor, Spline Arcade, Ayyappa Society Main Road, Sri Sai Nagar, Madhapur, Hyderabad, Telangana - 500081',
+    'UP LIFE INDIA PVT LTD': 'Ground Floor, Shanmukh Emmpire, 83, Ayyappa Society, Mega Hills, Madhapur, Hyderabad, Telangana - 500081',
+    'ZERO7 TECHNOLOGIES TRAINING & DEVELOPMENT': 'Ground Floor, Shanmukh Emmpire, Ayyappa Society, Main Road, Madhapur, Hyderabad, Telangana - 500081',
+}
+DEFAULT_COMPANY = 'Arah Infotech Pvt Ltd'
+LEGAL_SUFFIXES = {"pvt", "private", "ltd", "limited", "llp", "inc", "co"}
+
+
+def normalize_company_name(name):
+    """'Arah Infotech Pvt. Ltd' -> 'arah infotech'"""
+    words = re.sub(r"[^a-z0-9]+", " ", str(name).lower().replace("&", " and ")).split()
+    return " ".join(w for w in words if w not in LEGAL_SUFFIXES)
+
+
+def normalize_letter_type(letter_type):
+    return re.sub(r"[^a-z0-9]+", "_", (letter_type or DEFAULT_LETTER_TYPE).lower()).strip("_")
+
+
+def build_address_index(addresses):
+    """
+    Normalized name -> address, plus each company's leading brand word
+    ("arah", "vagarious", ...) so short names typed in the UI still resolve.
+    """
+    index = {}
+    for name, address in addresses.items():
+        key = normalize_company_name(name)
+        index[key] = address
+        brand = key.split(" ")[0]
+        if len(brand) >= 4:
+            index.setdefault(brand, address)
+    return index
+
+
+class CompiledTemplate:
+    def __init__(self, letter_type, version, template):
+        self.letter_type = letter_type
+        self.version = version
+        self.template = template
+        self.checked_at = time.monotonic()
+
+
+class TemplateRegistry:
+    """
+    Letter bodies (Jinja2) stored in the `letter_templates` collection, one document
+    per letter type with a `version` that is bumped on every change. Each body is
+    compiled once per version; the stored version is re-read at most every
+    TEMPLATE_RECHECK_SECONDS so edits made through another worker are picked up.
+    Bodies can be edited over the API, so they are compiled in Jinja2's sandbox
+    (no attribute access to internals such as __globals__, no mutating calls).
+    """
+    def __init__(self):
+        self.env = ImmutableSandboxedEnvironment(undefined=StrictUndefined, autoescape=False)
+        self.recheck_seconds = int(os.getenv("TEMPLATE_RECHECK_SECONDS", "30"))
+        self._compiled = {} # letter type -> CompiledTemplate
+        self._versions = {} # (letter type, version) -> CompiledTemplate
+        self._lock = threading.Lock()
+
+    def bundled(self):
+        return {path.stem: path.read_text(encoding="utf-8") for path in TEMPLATE_DIR.glob("*.html")}
+
+    def seed(self, db):
+        """Inserts bundled bodies for letter types the database doesn't have yet."""
+        for letter_type, body in self.bundled().items():
+            db.letter_templates.update_one(
+                {"_id": letter_type},
+                {"$setOnInsert": {"template_body": body, "version": 1, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+            self._snapshot(db, letter_type, 1, body)
+
+    def _snapshot(self, db, letter_type, version, body):
+        # Every version is kept so history rendered with it can be rebuilt later
+        db.letter_template_versions.update_one(
+            {"_id": f"{letter_type}:{version}"},
+            {"$setOnInsert": {"letter_type": letter_type, "version": version, "template_body": body,
+                              "created_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    def compile(self, body):
+        return self.env.from_string(body)
+
+    def _fresh(self, key, db):
+        cached = self._compiled.get(key)
+        if cached and (db is None or time.monotonic() - cached.checked_at < self.recheck_seconds):
+            return cached
+        return None
+
+    def _install(self, key, compiled):
+        with self._lock:
+            self._compiled[key] = compiled
+        return compiled
+
+    def _current(self, key, version):
+        """The cached template if it is still at `version` (and marks it checked)."""
+        cached = self._compiled.get(key)
+        # A type that used to fall back holds the agreement's template, whose version can match
+        if cached and cached.letter_type == key and cached.version == version:
+            cached.checked_at = time.monotonic()
+            return cached
+        return None
+
+    def get(self, db, letter_type):
+        key = normalize_letter_type(letter_type)
+        compiled = self._fresh(key, db)
+        if compiled:
+            return compiled
+
+        if db is None:
+            return self._load_bundled(key)
+
+        stored = db.letter_templates.find_one({"_id": key}, {"version": 1})
+        if stored is None:
+            if key != DEFAULT_LETTER_TYPE:
+                # Letter types without a body of their own use the agreement
+                return self._install(key, self.get(db, DEFAULT_LETTER_TYPE))
+            return self._load_bundled(key)
+
+        compiled = self._current(key, stored["version"])
+        if compiled:
+            return compiled
+
+        doc = db.letter_templates.find_one({"_id": key})
+        return self._install(key, CompiledTemplate(key, doc["version"], self.compile(doc["template_body"])))
+
+    async def get_async(self, db, letter_type):
+        """get() for the async Mongo client."""
+        key = normalize_letter_type(letter_type)
+        compiled = self._fresh(key, db)
+        if compiled:
+            return compiled
+
+        stored = await db.letter_templates.find_one({"_id": key}, {"version": 1})
+        if stored is None:
+            if key != DEFAULT_LETTER_TYPE:
+                return self._install(key, await self.get_async(db, DEFAULT_LETTER_TYPE))
+            return self._load_bundled(key)
+
+        compiled = self._current(key, stored["version"])
+        if compiled:
+            return compiled
+
+        doc = await db.letter_templates.find_one({"_id": key})
+        return self._install(key, CompiledTemplate(key, doc["version"], self.compile(doc["template_body"])))
+
+    def _load_bundled(self, key):
+        body = self.bundled().get(key) or self.bundled()[DEFAULT_LETTER_TYPE]
+        return self._install(key, CompiledTemplate(key, 0, self.compile(body)))
+
+    def save(self, db, letter_type, body, sample_context=None):
+        """
+        Stores a new body. Raises jinja2.TemplateSyntaxError if it doesn't compile and,
+        when a sample_context is given, whatever rendering it raises (SecurityError for
+        sandbox violations, UndefinedError for unknown variables).
+        """
+        key = normalize_letter_type(letter_type)
+        template = self.compile(body)
+        if sample_context is not None:
+            template.render(sample_context)
+        doc = db.letter_templates.find_one_and_update(
+            {"_id": key},
+            {"$set": {"template_body": body, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._snapshot(db, key, doc["version"], body)
+        with self._lock:
+            self._compiled[key] = CompiledTemplate(key, doc["version"], template)
+        return doc["version"]
+
+    def get_version(self, db, letter_type, version):
+        """A specific (immutable) version of a body, e.g. the one a history entry used."""
+        key = (letter_type, version)
+        compiled = self._versions.get(key)
+        if compiled is None:
+            snapshot = db.letter_template_versions.find_one({"_id": f"{letter_type}:{version}"}) if version else None
+            if snapshot is not None:
+                body = snapshot["template_body"]
+            else:
+                # Version 0 is the bundled body used before the database was seeded
+                body = self.bundled().get(letter_type) or self.bundled()[DEFAULT_LETTER_TYPE]
+            compiled = CompiledTemplate(letter_type, version, self.compile(body))
+            with self._lock:
+                self._versions[key] = compiled
+        return compiled
+
+    def invalidate(self, letter_type=None):
+        with self._lock:
+            if letter_type is None:
+                self._compiled.clear()
+            else:
+                self._compiled.pop(normalize_letter_type(letter_type), None)
+
 
 class AIService:
     def __init__(self):
-        pass
+        self.templates = TemplateRegistry()
+        self.addresses = build_address_index(COMPANY_ADDRESSES)
 
-    def generate_letter(self, employee_data, letter_type):
+    def generate_letter(self, employee_data, letter_type, db=None):
         """
         Generates the exact agreement template as requested without AI hallucination.
         """
-        return self._fallback_template(employee_data, letter_type)
+        return self.render(self.templates.get(db, letter_type), employee_data)
 
-    def _fallback_template(self, data, letter_type):
+    def render(self, template, employee_data):
+        return template.template.render(self.build_context(employee_data))
+
+    def company_address(self, company):
+        """
+        Exact (normalized) name first, then the original case-insensitive substring
+        match in either direction ("UP LIFE" -> UP LIFE INDIA PVT LTD), then the brand
+        word alias, then the default company's address.
         """
-        The EXACT agreement template matching the Vagarious Solutions reference PDF.
-        Each numbered section is wrapped in <div class="section-block"> to prevent
-        orphan headings (heading at bottom of page, content on next page).
+        key = normalize_company_name(company)
+        address = self.addresses.get(key)
+        if address:
+            return address
+        lowered = str(company).lower()
+        for name, address in COMPANY_ADDRESSES.items():
+            if name.lower() in lowered or lowered in name.lower():
+                return address
+        return self.addresses.get(key.split(" ")[0] if key else "") or COMPANY_ADDRESSES[DEFAULT_COMPANY]
+
+    def build_context(self, data):
         """
-        company = data.get('company_name', 'Arah Infotech Pvt Ltd')
-        partner_company = data.get('name', 'Partner Company')
-        percentage = data.get('percentage', 0)
-        partner_address = data.get('address', '')
+        Values the letter bodies use. The agreement matches the Vagarious Solutions
+        reference PDF; each numbered section is wrapped in <div class="section-block">
+        to prevent orphan headings.
+        """
+        company = data.get('company_name', DEFAULT_COMPANY)
         joining_date = data.get('joining_date')
         if not joining_date:
             joining_date = data.get('current_date', '')
-        
+
         # If the date includes time, cleanly format it
         if joining_date and " " in str(joining_date):
             joining_date = str(joining_date).split(" ")[0]
-            
-        replacement = data.get('replacement')
-        if not replacement:
-            replacement = 60
-            
-        invoice_post_joining = data.get('invoice_post_joining')
-        if not invoice_post_joining:
-            invoice_post_joining = 45
-            
-        signature = data.get('signature')
-        if not signature:
-            signature = 'Authorized Signatory'
-        
+
+        signature = data.get('signature') or 'Authorized Signatory'
+
         # Split signature into name and designation if " - " separator is used
         sig_name = signature
         sig_designation = ''
@@ -48,182 +263,19 @@ class AIService:
             parts = signature.split(' - ', 1)
             sig_name = parts[0].strip()
             sig_designation = parts[1].strip()
-        
-        # Company registered office addresses
-        COMPANY_ADDRESSES = {
-            'Arah Infotech Pvt Ltd': 'Ground Floor, Shanmukh Emmpire, Ayyappa Society, Main Road, Madhapur, Hyderabad, Telangana - 500081',
-            'VAGARIOUS SOLUTIONS PVT LTD': 'Plot No. 1208, Flat No. 201, 2nd Floor, Spline Arcade, Ayyappa Society Main Road, Sri Sai Nagar, Madhapur, Hyderabad, Telangana - 500081',
-            'UP LIFE INDIA PVT LTD': 'Ground Floor, Shanmukh Emmpire, 83, Ayyappa Society, Mega Hills, Madhapur, Hyderabad, Telangana - 500081',
-            'ZERO7 TECHNOLOGIES TRAINING & DEVELOPMENT': 'Ground Floor, Shanmukh Emmpire, Ayyappa Society, Main Road, Madhapur, Hyderabad, Telangana - 500081',
+
+        return {
+            "company": company,
+            "company_address": self.company_address(company),
+            "partner_company": data.get('name', 'Partner Company'),
+            "partner_address": data.get('address', ''),
+            "percentage": data.get('percentage', 0),
+            "joining_date": joining_date,
+            "replacement": data.get('replacement') or 60,
+            "invoice_post_joining": data.get('invoice_post_joining') or 45,
+            "sig_name": sig_name,
+            "sig_designation": sig_designation,
         }
-        
-        # Look up company address (case-insensitive match)
-        company_address = ''
-        for key, addr in COMPANY_ADDRESSES.items():
-            if key.lower() in company.lower() or company.lower() in key.lower():
-                company_address = addr
-                break
-        if not company_address:
-            company_address = COMPANY_ADDRESSES.get('Arah Infotech Pvt Ltd', '')
-        
-        return f"""<div style="font-family: Arial, Helvetica, sans-serif; color: #000; line-height: 1.6; max-width: 800px; margin: 0 auto; text-align: justify; padding-bottom: 50px;">
-
-<h3 style="text-align: center; text-decoration: underline; font-size: 13px; margin-bottom: 30px; word-wrap: break-word; overflow-wrap: break-word;">AGREEMENT B/W {company.upper()} - {partner_company}</h3>
-
-<p style="margin-bottom: 20px;">This Agreement is made and entered into on <strong>{joining_date}</strong> by and between:</p>
-
-<p style="margin-bottom: 5px;"><strong>{company.upper()}</strong></p>
-<p style="margin-bottom: 5px;">Registered Office: {company_address}</p>
-<p style="margin-bottom: 20px;">(Hereinafter referred to as &ldquo;{company}&rdquo; or the &ldquo;Service Provider&rdquo;) <strong>AND</strong></p>
-
-<p style="margin-bottom: 5px;"><strong>{partner_company}</strong></p>
-<p style="margin-bottom: 5px;">{partner_address}</p>
-<p style="margin-bottom: 20px;">&ldquo;Parties.&rdquo;</p>
-
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">RECITALS</h4>
-<p>WHEREAS, the Client is engaged in the field of Information Technology and Services;</p>
-<p>WHEREAS, {company} is engaged in human resource management and consultancy services, including recruitment, training, and business process outsourcing;</p>
-<p>WHEREAS, the Client desires to avail recruitment services, and {company} has represented that it possesses the skills, expertise, and resources to provide such services;</p>
-<p><strong>NOW, THEREFORE,</strong> in consideration of the mutual covenants herein, the Parties agree as follows:</p>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">1. CONTRACT TERM</h4>
-<ul>
-<li>This Agreement shall remain valid for 12 months from the date of signing unless terminated earlier as per Clause 11.</li>
-<li>Upon expiry, this Agreement may be extended by mutual written consent.</li>
-<li>The Client reserves the right to appoint multiple vendors. {company} acknowledges that its appointment is non-exclusive.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">2. PROFESSIONAL FEES</h4>
-<ul>
-<li>The Client shall pay {company} professional charges as follows:</li>
-<li>All Levels &ndash; <strong>{percentage}%</strong> of Annual CTC (Applicable GST extra).</li>
-<li>Annual CTC shall include Basic Salary, HRA, PF, LTA, Medical, Conveyance, and other fixed allowances. It shall exclude sales incentives, performance bonuses, and stock options.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">3. SERVICE METHODOLOGY</h4>
-<ul>
-<li>The Client shall share requirements via email/telephone.</li>
-<li>{company} shall confirm within 7 working days its ability to provide candidates.</li>
-<li>{company} shall shortlist and submit resumes matching the Client&rsquo;s requirements.</li>
-<li>The Client shall review resumes and provide feedback within 2 working days. During this time, {company} shall not propose the same candidates elsewhere.</li>
-<li>If the Client confirms a candidate already exists in its database, no fee shall apply.</li>
-<li>{company} shall coordinate interviews and follow up until candidate joining.</li>
-<li>If a candidate is hired within 3 months of initial submission (including via Client advertisements), service charges shall apply.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">4. INVOICES &amp; PAYMENT TERMS</h4>
-<ul>
-<li>On confirmation of candidate joining, {company} shall raise an invoice <strong>{invoice_post_joining} days</strong> post joining.</li>
-<li>The Client shall process payment within <strong>15 days</strong> of invoice date, after deduction of applicable taxes.</li>
-<li>Fees are payable irrespective of whether the candidate is on trial or probation.</li>
-<li>No payment is due if a candidate absconds or resigns within 90 days of joining.</li>
-<li>In case of duplicate referrals, payment shall be made to the vendor whose reference was received first.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">5. REPLACEMENT GUARANTEE</h4>
-<ul>
-<li>If a candidate absconds in <strong>{replacement} Days</strong> replacement is applicable and {company} shall provide a replacement within 10 working days.</li>
-<li>If the candidate is terminated due to misconduct, breach of confidentiality, or non-performance by the company after <strong>60 days</strong>, {company} shall not provide a replacement, but, if he is terminated in 60 Days {company.lower()} will provide replacement.</li>
-<li>If replacement is not provided, the professional fee shall be refunded or adjusted against future invoices.</li>
-<li>This guarantee does not apply if the Client terminates for business reasons.</li>
-<li>The Client shall provide 1-week prior notice to {company} before termination for this guarantee to apply.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">6. RESPONSIBILITIES OF {company.upper()}</h4>
-<ul>
-<li>Deliver services diligently and promote the Client&rsquo;s interests.</li>
-<li>Not forward selected candidates to other clients until released by the Client.</li>
-<li>Arrange interviews at mutually convenient times.</li>
-<li>Notify the Client if a proposed candidate accepts another assignment.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">7. CONFIDENTIALITY &amp; NON-SOLICITATION</h4>
-<ul>
-<li>{company} shall not disclose Client&rsquo;s confidential information or business practices.</li>
-<li>{company} shall not solicit or influence Client employees.</li>
-<li>This clause survives the termination of this Agreement</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">8. NON-ASSIGNMENT</h4>
-<ul>
-<li>This Agreement shall not be assigned by {company} to any third party without prior written consent of the Client.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">9. DISPUTE RESOLUTION &amp; ARBITRATION</h4>
-<ul>
-<li>Any dispute shall be referred to arbitration under the Arbitration and Conciliation Act, 1996.</li>
-<li>A sole arbitrator shall be appointed with mutual consent.</li>
-<li>The arbitration shall be conducted in Hyderabad, in the English language.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">10. GOVERNING LAW &amp; JURISDICTION</h4>
-<ul>
-<li>This Agreement shall be governed by the laws of India. Courts at Hyderabad and Secunderabad shall have exclusive jurisdiction.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">11. TERMINATION</h4>
-<ul>
-<li>Either Party may terminate this Agreement with 30 days&rsquo; prior written notice.</li>
-<li>The Client may terminate immediately without notice if {company} breaches terms.</li>
-<li>No service fee shall be payable for placements made after termination unless the Agreement is renewed.</li>
-</ul>
-</div>
-
-<div class="section-block">
-<h4 style="text-decoration: underline; margin-top: 25px;">12. ENTIRE AGREEMENT</h4>
-<ul>
-<li>This Agreement constitutes the entire understanding between the Parties and supersedes all prior discussions. Any amendments shall be in writing and signed by both Parties.</li>
-</ul>
-</div>
-
-<br>
-<p><strong>IN WITNESS WHEREOF,</strong> the Parties hereto have executed this Agreement on the date first above written.</p>
-
-<table style="width: 100%; margin-top: 40px; border: none; border-collapse: collapse;">
-<tbody>
-<tr>
-<td style="text-align: left; width: 50%; border: none; vertical-align: top; padding: 0;"><strong>{company.upper()}</strong></td>
-<td style="text-align: left; width: 50%; border: none; vertical-align: top; padding: 0;"><strong>{partner_company}</strong></td>
-</tr>
-<tr>
-<td style="border: none; padding: 40px 0 10px 0;"></td>
-<td style="border: none; padding: 40px 0 10px 0;"></td>
-</tr>
-<tr>
-<td style="border: none; padding: 5px 0;"><strong>NAME :</strong>{sig_name}</td>
-<td style="border: none; padding: 5px 0;"><strong>NAME :</strong></td>
-</tr>
-<tr>
-<td style="border: none; padding: 5px 0;"><strong>DESIGNATION :</strong> {sig_designation if sig_designation else 'MANAGING DIRECTOR'}</td>
-<td style="border: none; padding: 5px 0;"><strong>DESIGNATION :</strong></td>
-</tr>
-</tbody>
-</table>
-</div>"""
 
 # Singleton instance
 ai_engine = AIService()
@@ -0,0 +1,209 @@
+from collections import OrderedDict
+from html.parser import HTMLParser
+import hashlib
+import threading
+import io
+import re
+import os
+
+BLOCK_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li"}
+# Start a new paragraph like BLOCK_TAGS, but may also wrap blocks of their own.
+# contentEditable writes every new line of an edited letter as a <div>.
+CONTAINER_TAGS = {"div", "section", "article", "blockquote", "header", "footer", "main", "address", "center"}
+VOID_TAGS = {"img", "hr", "input", "meta", "link", "wbr", "col", "area", "source"}
+INLINE_STYLES = {"strong": "bold", "b": "bold", "em": "italic", "i": "italic", "u": "underline"}
+
+
+def css_effects(style):
+    """Run effects set by an inline style attribute, e.g. the spans contentEditable writes."""
+    effects = {}
+    for declaration in style.lower().split(";"):
+        prop, _, value = declaration.partition(":")
+        prop, value = prop.strip(), value.strip()
+        if prop == "font-weight":
+            effects["bold"] = value in ("bold", "bolder") or (value.isdigit() and int(value) >= 600)
+        elif prop == "font-style":
+            effects["italic"] = value in ("italic", "oblique")
+        elif prop in ("text-decoration", "text-decoration-line") and "underline" in value:
+            effects["underline"] = True
+    return effects
+
+
+class AgreementDocxBuilder(HTMLParser):
+    """
+    Writes agreement HTML straight into a python-docx Document. Agreements only use
+    a handful of elements (headings, paragraphs, lists, bold text and the signature
+    table), so one streaming pass replaces HtmlToDocx's generic DOM conversion.
+    Letters edited in the browser add <div> lines and styled spans, which are
+    mapped to paragraphs and run formatting.
+    Section headings are kept with the paragraph that follows them, like the
+    section-block rule in the PDF renderer.
+    """
+    def __init__(self, document):
+        super().__init__(convert_charrefs=True)
+        self.document = document
+        self.paragraph = None
+        self.inline = [] # stack of (tag, style attribute)
+        self.containers = [] # open CONTAINER_TAGS, as (tag, style attribute)
+        self.lists = [] # "ul" / "ol"
+        self.table = None
+        self.cell_index = -1
+        self.cell = None
+        # Looking a style up by name scans the whole styles part; do it once
+        self.list_styles = {"ul": document.styles["List Bullet"], "ol": document.styles["List Number"]}
+
+    def _style(self, attrs):
+        return dict(attrs).get("style", "") or ""
+
+    def _new_paragraph(self, tag, style):
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+        container = self.cell if self.cell is not None else self.document
+        if tag == "li":
+            paragraph = container.add_paragraph()
+            paragraph._p.get_or_add_pPr().style = self.list_styles[self.lists[-1] if self.lists else "ul"].style_id
+        elif self.cell is not None and not self.cell.paragraphs[-1].text and len(self.cell.paragraphs) == 1:
+            paragraph = self.cell.paragraphs[0]
+        else:
+            paragraph = container.add_paragraph()
+
+        style = style.replace(" ", "").lower()
+        if "text-align:center" in style:
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        elif "text-align:right" in style:
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+        elif "text-align:justify" in style:
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+        if tag[0] == "h":
+            paragraph.paragraph_format.keep_with_next = True
+        return paragraph
+
+    def handle_starttag(self, tag, attrs):
+        style = self._style(attrs)
+        if tag in BLOCK_TAGS:
+            self.paragraph = self._new_paragraph(tag, style)
+            self.inline = [(tag, style)]
+        elif tag in ("ul", "ol"):
+            self.lists.append(tag)
+        elif tag == "table":
+            self.table = self.document.add_table(rows=0, cols=0)
+        elif tag == "tr" and self.table is not None:
+            self.cell_index = -1
+            self.table.add_row()
+        elif tag == "td" and self.table is not None:
+            self.cell_index += 1
+            if self.cell_index >= len(self.table.columns):
+                self.table.add_column(self.document.sections[0].page_width // 2)
+            self.cell = self.table.rows[-1].cells[self.cell_index]
+            self.paragraph = None
+        elif tag in CONTAINER_TAGS:
+            self.paragraph = None
+            self.containers.append((tag, style))
+        elif tag == "br":
+            if self.paragraph is not None:
+                self.paragraph.add_run().add_break()
+            elif self.containers:
+                # <div><br></div> is how contentEditable writes an empty line
+                self.paragraph = self._new_paragraph("p", self.containers[-1][1])
+        elif tag not in VOID_TAGS:
+            self.inline.append((tag, style))
+
+    def handle_endtag(self, tag):
+        if tag in BLOCK_TAGS:
+            self.paragraph = None
+            self.inline = []
+        elif tag in ("ul", "ol") and self.lists:
+            self.lists.pop()
+        elif tag == "table":
+            self.table = None
+            self.cell = None
+        elif tag == "td":
+            self.cell = None
+            self.paragraph = None
+        elif tag in CONTAINER_TAGS:
+            self.paragraph = None
+            if self.containers and self.containers[-1][0] == tag:
+                self.containers.pop()
+        elif self.inline and self.inline[-1][0] == tag:
+            self.inline.pop()
+
+    def handle_data(self, data):
+        text = re.sub(r"\s+", " ", data)
+        if self.paragraph is None or not self.paragraph.text:
+            text = text.lstrip()
+        if not text:
+            return
+        if self.paragraph is None:
+            # Bare text (inside a table cell or a <div>): give it a paragraph of its own
+            self.paragraph = self._new_paragraph("p", self.containers[-1][1] if self.containers else "")
+        run = self.paragraph.add_run(text)
+        # Outer to inner, so a nested style (font-weight: normal) overrides its parent
+        effects = {}
+        for tag, style in self.containers + self.inline:
+            if tag in INLINE_STYLES:
+                effects[INLINE_STYLES[tag]] = True
+            if tag[0] == "h" and tag in BLOCK_TAGS:
+                effects["bold"] = True
+            effects.update(css_effects(style))
+        for effect, on in effects.items():
+            if on:
+                setattr(run, effect, True)
+
+
+def build_docx(html_content):
+    """Agreement HTML -> .docx bytes. Module level so it can run in a worker process."""
+    from docx import Document
+
+    document = Document()
+    builder = AgreementDocxBuilder(document)
+    builder.feed(html_content)
+    builder.close()
+    stream = io.BytesIO()
+    document.save(stream)
+    return stream.getvalue()
+
+
+class DocxService:
+    """
+    DOCX exports cached by the sha256 of their HTML (bounded LRU, DOCX_CACHE_SIZE),
+    so downloading an unchanged agreement again costs a dict lookup. Bulk exports
+    (POST /letters/export) reuse cached files and build the rest on the shared
+    process pool.
+    """
+    def __init__(self, max_size=None):
+        self.max_size = max_size or int(os.getenv("DOCX_CACHE_SIZE", "64"))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(html_content):
+        return hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+            return data
+
+    def _put(self, key, data):
+        with self._lock:
+            self._cache[key] = data
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def cached(self, html_content):
+        return self._get(self.content_hash(html_content))
+
+    def render(self, html_content):
+        key = self.content_hash(html_content)
+        data = self._get(key)
+        if data is None:
+            data = build_docx(html_content)
+            self._put(key, data)
+        return data
+
+
+# Singleton instance
+docx_exporter = DocxService()
@@ -5,7 +5,12 @@ from email.mime.application import MIMEApplication
 import os
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 import base64
+import orjson
+import queue
+import threading
+import time
 
 # Load environment variables from .env file
 # Load environment variables from .env file
@@ -22,7 +27,124 @@ if dotenv_path.exists():
 else:
     load_dotenv(override=True) # Fallback to default search
 
+class RateLimiter:
+    """
+    Token bucket shared by every thread sending through one provider in this process.
+    Each API worker process has its own; the outbox also counts sends per minute in
+    Mongo so the quota holds across processes.
+    """
+    def __init__(self, per_minute, burst=None):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1, int(per_minute / 6))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMTPPool:
+    """
+    Keeps a few authenticated SMTP connections open and reuses them, so a bulk run
+    pays for the connect + STARTTLS + login round trips once per connection instead
+    of once per email. Connections are checked with NOOP before use and replaced if
+    the server dropped them.
+    """
+    def __init__(self, host, port, username, password, size=3, max_messages=100, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.max_messages = max_messages # servers cap messages per session; recycle before that
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.starttls()
+        server.login(self.username, self.password)
+        server.sent_count = 0
+        return server
+
+    def _is_alive(self, server):
+        try:
+            return server.noop()[0] == 250
+        except OSError: # includes SMTPException / SMTPServerDisconnected
+            return False
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    server = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._is_alive(server):
+                    return server
+                self._close(server)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, server, healthy=True):
+        if healthy and server.sent_count < self.max_messages:
+            self._idle.put(server)
+        else:
+            self._close(server)
+        self._slots.release()
+
+    def send_message(self, msg):
+        # One retry on a fresh connection if the pooled one died mid-send
+        for attempt in range(2):
+            server = self._acquire()
+            try:
+                server.send_message(msg)
+                server.sent_count += 1
+                self._release(server)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                self._release(server, healthy=False)
+                if attempt == 1:
+                    raise
+            except smtplib.SMTPResponseException:
+                # The server rejected this message; the connection itself is still fine
+                self._release(server)
+                raise
+            except Exception:
+                self._release(server, healthy=False)
+                raise
+
+    def close(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
 class EmailService:
+    BREVO_BATCH_LIMIT = 1000 # messageVersions allowed per Brevo API call
+
     def __init__(self):
         # SMTP Config
         self.smtp_server = "smtp.gmail.com"
@@ -30,6 +152,11 @@ class EmailService:
         self.sender_email = os.getenv("MAIL_USERNAME", "").strip()
         self.sender_password = os.getenv("MAIL_PASSWORD", "").strip()
         
+        self.smtp_pool = SMTPPool(
+            self.smtp_server, self.smtp_port, self.sender_email, self.sender_password,
+            size=int(os.getenv("SMTP_POOL_SIZE", "3"))
+        )
+
         # Brevo API Config
         self.brevo_api_key = os.getenv("BREVO_API_KEY", "").strip()
         self.brevo_sender_email = os.getenv("BREVO_SENDER_EMAIL", self.sender_email).strip() # Fallback to MAIL_USERNAME if not set
@@ -39,16 +166,31 @@ class EmailService:
         print(f"DEBUG: DOTENV Path checked: {dotenv_path}")
         print(f"DEBUG: Brevo Key loaded: {'YES' if self.brevo_api_key else 'NO'} (Length: {len(self.brevo_api_key)})")
         print(f"DEBUG: Brevo Sender: {self.brevo_sender_email}")
-        
-    def send_via_brevo(self, recipient_email, candidate_name, subject, body, pdf_content=None, company_name="Arah Infotech Pvt Ltd"):
-        url = "https://api.brevo.com/v3/smtp/email"
-        
-        headers = {
+
+        # Keep-alive HTTP client for Brevo: one pooled TLS connection per worker thread
+        self.brevo_url = os.getenv("BREVO_API_URL", "https://api.brevo.com/v3/smtp/email")
+        self.brevo_timeout = (5, 30) # (connect, read) seconds
+        self.brevo_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(os.getenv("BREVO_POOL_SIZE", "10")))
+        self.brevo_session.mount("https://", adapter)
+        self.brevo_session.mount("http://", adapter)
+        self.brevo_session.headers.update({
             "accept": "application/json",
             "api-key": self.brevo_api_key,
             "content-type": "application/json"
+        })
+
+        # Per-provider send quotas (messages per minute)
+        self.rate_limits = {
+            "brevo": RateLimiter(int(os.getenv("BREVO_RATE_PER_MINUTE", "300"))),
+            "smtp": RateLimiter(int(os.getenv("SMTP_RATE_PER_MINUTE", "20"))),
         }
-        
+
+    @property
+    def provider(self):
+        return "brevo" if self.brevo_api_key else "smtp"
+
+    def send_via_brevo(self, recipient_email, candidate_name, subject, body, pdf_content=None, company_name="Arah Infotech Pvt Ltd"):
         # Ensure sender email is valid (Brevo requires verified sender)
         sender_email = self.brevo_sender_email if self.brevo_sender_email else self.sender_email
         
@@ -59,26 +201,21 @@ class EmailService:
             "htmlContent": body.replace('\n', '<br>') # Brevo uses htmlContent
         }
         
+        body_bytes = orjson.dumps(payload)
         if pdf_content:
-            # Brevo expects base64 encoded content
-            try:
-                # If pdf_content is bytes, encode it. If it's already base64 string, use it.
-                if isinstance(pdf_content, bytes):
-                    b64_content = base64.b64encode(pdf_content).decode('utf-8')
-                else:
-                    b64_content = pdf_content
-                    
-                payload["attachment"] = [
-                    {
-                        "content": b64_content,
-                        "name": f"Agreement_{candidate_name.replace(' ', '_')}.pdf"
-                    }
-                ]
-            except Exception as e:
-                print(f"Error encoding PDF for Brevo: {e}")
-                
+            # Brevo expects base64 in the JSON body. Encode the PDF exactly once and splice the
+            # ASCII bytes into the already-serialized payload, instead of decoding to str and
+            # letting the JSON encoder copy/escape a multi-megabyte string again.
+            b64_content = base64.b64encode(pdf_content) if isinstance(pdf_content, (bytes, bytearray, memoryview)) \
+                else pdf_content.encode('ascii') # already base64
+            attachment_name = orjson.dumps(f"Agreement_{candidate_name.replace(' ', '_')}.pdf")
+            body_bytes = b"".join([
+                body_bytes[:-1],
+                b',"attachment":[{"name":', attachment_name, b',"content":"', b64_content, b'"}]}'
+            ])
+
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = self.brevo_session.post(self.brevo_url, data=body_bytes, timeout=self.brevo_timeout)
             if response.status_code == 201 or response.status_code == 200: # 201 Created or 200 OK
                 return {"status": "success", "message": "Email sent successfully via Brevo"}
             else:
@@ -88,6 +225,69 @@ class EmailService:
              print(f"Brevo Exception: {str(e)}")
              return {"status": "error", "message": str(e)}
 
+    def send_batch_via_brevo(self, recipients, subject, body, company_name="Arah Infotech Pvt Ltd"):
+        """
+        Sends the same message to many recipients with one Brevo call per 1000 using
+        messageVersions. `body`/`subject` may use {{ params.name }}; each recipient is
+        {"email", "name", "params"}. Returns one result per recipient, in order.
+        """
+        sender_email = self.brevo_sender_email if self.brevo_sender_email else self.sender_email
+        results = []
+
+        for start in range(0, len(recipients), self.BREVO_BATCH_LIMIT):
+            chunk = recipients[start:start + self.BREVO_BATCH_LIMIT]
+            payload = {
+                "sender": {"name": f"{company_name} HR", "email": sender_email},
+                "subject": subject,
+                "htmlContent": body.replace('\n', '<br>'),
+                "messageVersions": [
+                    {
+                        "to": [{"email": r["email"], "name": r.get("name") or r["email"]}],
+                        "params": {"name": r.get("name") or "", **(r.get("params") or {})}
+                    }
+                    for r in chunk
+                ]
+            }
+            try:
+                self.rate_limits["brevo"].acquire()
+                response = self.brevo_session.post(self.brevo_url, json=payload, timeout=self.brevo_timeout)
+                if response.status_code in (200, 201):
+                    message_ids = response.json().get("messageIds", [])
+                    for i, r in enumerate(chunk):
+                        results.append({
+                            "email": r["email"], "status": "success",
+                            "message_id": message_ids[i] if i < len(message_ids) else None
+                        })
+                else:
+                    print(f"Brevo API Error: {response.text}")
+                    results.extend({"email": r["email"], "status": "error", "message": f"Brevo API Error: {response.text}"} for r in chunk)
+            except Exception as e:
+                print(f"Brevo Exception: {str(e)}")
+                results.extend({"email": r["email"], "status": "error", "message": str(e)} for r in chunk)
+
+        return results
+
+    def send_batch(self, recipients, subject, body, company_name="Arah Infotech Pvt Ltd"):
+        """
+        Same message (no attachment) to many recipients: batched on Brevo, pooled SMTP otherwise.
+        """
+        if self.brevo_api_key:
+            return self.send_batch_via_brevo(recipients, subject, body, company_name=company_name)
+
+        results = []
+        for r in recipients:
+            name = r.get("name") or ""
+            params = {"name": name, **(r.get("params") or {})}
+            personal_subject, personal_body = subject, body
+            for key, value in params.items():
+                personal_subject = personal_subject.replace(f"{{{{ params.{key} }}}}", str(value))
+                personal_body = personal_body.replace(f"{{{{ params.{key} }}}}", str(value))
+            result = self.send_offer_letter(recipient_email=r["email"], candidate_name=name,
+                                            email_body=personal_body, subject=personal_subject,
+                                            company_name=company_name)
+            results.append({"email": r["email"], **result})
+        return results
+
     def send_offer_letter(self, recipient_email, candidate_name, pdf_content=None, letter_content=None, email_body=None, subject=None, company_name="Arah Infotech Pvt Ltd"):
         """
         Sends an email with the offer letter.
@@ -111,6 +311,8 @@ class EmailService:
         if not subject:
             subject = f"Agreement - {candidate_name}"
 
+        self.rate_limits[self.provider].acquire()
+
         # PRIORITY: Use Brevo API if Key exists
         if self.brevo_api_key:
             return self.send_via_brevo(recipient_email=recipient_email, candidate_name=candidate_name, subject=subject, body=final_body, pdf_content=pdf_content, company_name=company_name)
@@ -134,11 +336,7 @@ class EmailService:
             if letter_content and not pdf_content:
                  msg.attach(MIMEText(f"\n\n--- AGREEMENT TEXT ---\n{letter_content}", 'plain'))
 
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.sender_email, self.sender_password)
-            server.send_message(msg)
-            server.quit()
+            self.smtp_pool.send_message(msg)
             
             return {"status": "success", "message": "Email sent successfully"}
 
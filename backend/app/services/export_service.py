@@ -0,0 +1,76 @@
+from concurrent.futures import wait, FIRST_COMPLETED
+from itertools import islice
+import html as html_lib
+from .process_pool import process_pool
+from .pdf_service import render_agreement
+from .docx_service import docx_exporter, build_docx
+
+EXPORT_FORMATS = {
+    # format -> (extension, already compressed: store instead of deflate)
+    "pdf": ("pdf", True),
+    "docx": ("docx", True),
+    "html": ("html", False),
+}
+
+HTML_PAGE = '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>\n<body>\n{body}\n</body></html>\n'
+
+
+def iter_completed(executor, fn, items, window):
+    """
+    Runs fn(*args) for each (key, args) in items, keeping at most `window` in flight,
+    and yields (key, result_or_exception) in completion order.
+    """
+    items = iter(items)
+    pending = {}
+
+    def refill(n):
+        for key, args in islice(items, n):
+            pending[executor.submit(fn, *args)] = key
+
+    refill(window)
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = pending.pop(future)
+            error = future.exception()
+            yield key, error if error is not None else future.result()
+        refill(len(done))
+
+
+class ExportService:
+    """
+    Builds export files for already generated letters on the shared process pool
+    and hands them back as each one finishes. Only `window()` files are in flight
+    at a time, so memory stays flat however many companies are exported.
+    """
+    def window(self):
+        return process_pool.max_workers * 2
+
+    def iter_files(self, letters, file_format, template_url):
+        """
+        letters: iterable of (key, title, html). Yields (key, bytes or exception).
+        """
+        if file_format == "html":
+            for key, title, html in letters:
+                yield key, HTML_PAGE.format(title=html_lib.escape(title), body=html).encode("utf-8")
+            return
+
+        if file_format == "docx":
+            # Reuse anything already in the DOCX cache; build the rest in parallel
+            pending = []
+            for key, title, html in letters:
+                cached = docx_exporter.cached(html)
+                if cached is not None:
+                    yield key, cached
+                else:
+                    pending.append((key, (html,)))
+            for key, data in iter_completed(process_pool.executor, build_docx, pending, self.window()):
+                yield key, data
+            return
+
+        jobs = ((key, (html, template_url)) for key, title, html in letters)
+        yield from iter_completed(process_pool.executor, render_agreement, jobs, self.window())
+
+
+# Singleton instance
+letter_exporter = ExportService()
@@ -0,0 +1,245 @@
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from openpyxl import load_workbook
+from .sequence_service import emp_id_sequence
+from ..normalization import normalize_company, split_unset
+import pandas as pd
+import os
+
+# Normalized header aliases for each imported field (first match wins)
+COLUMN_ALIASES = {
+    "email": ['email', 'email_id', 'email_address'],
+    "name": ['name', 'full_name'],
+    "designation": ['designation', 'role'],
+    "department": ['department'],
+    "joining_date": ['joining_date', 'doj'],
+    "emp_id": ['emp_id'],
+    "ctc": ['ctc', 'annual_ctc'],
+    "location": ['location'],
+    "employment_type": ['employment_type'],
+}
+
+FIELD_DEFAULTS = {
+    "name": "Unknown",
+    "designation": "TBD",
+    "department": "General",
+    "location": "Remote",
+    "employment_type": "Full Time",
+}
+
+PROFESSIONAL_TAX = 2400
+
+
+class ImportService:
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.chunk_rows = int(os.getenv("IMPORT_CHUNK_ROWS", "5000"))
+
+    def normalize_headers(self, df):
+        df.columns = [str(c).lower().strip().replace(' ', '_') for c in df.columns]
+        return df
+
+    def resolve_columns(self, columns):
+        """
+        Maps each field to the sheet column that holds it (or None), once per file.
+        """
+        resolved = {}
+        for field, aliases in COLUMN_ALIASES.items():
+            resolved[field] = next((alias for alias in aliases if alias in columns), None)
+        return resolved
+
+    def import_frame(self, db, df, cols=None, row_offset=0):
+        """
+        Validates and inserts one DataFrame of companies.
+        `row_offset` is the DataFrame position of the first row in the whole sheet.
+        Earlier parts of the same file are already in the database by the time a
+        part is checked, so the lookup below reports them as existing; anything
+        that slips past it is rejected by the unique email index in insert_docs.
+        Returns (imported_count, errors) with the same messages as the row-by-row importer.
+        """
+        if cols is None:
+            cols = self.resolve_columns(df.columns)
+
+        df = df.reset_index(drop=True)
+        row_numbers = pd.Series(range(len(df))) + row_offset + 2 # +2: header row & 1-based rows
+        errors = [] # (row_number, message) so the report stays in sheet order
+
+        # 1. Email
+        emails = df[cols["email"]] if cols["email"] else pd.Series([None] * len(df), dtype=object)
+        missing = emails.isna() | (emails.astype(str).str.strip() == "")
+        for row in row_numbers[missing]:
+            errors.append((row, f"Row {row}: Email missing"))
+
+        # 2. One round trip for every email in this part
+        candidates = emails[~missing].tolist()
+        existing = set()
+        if candidates:
+            existing.update(
+                doc["email"] for doc in db.companies.find({"email": {"$in": candidates}}, {"email": 1, "_id": 0})
+            )
+        in_db = ~missing & emails.isin(existing)
+
+        # 3. CTC (vectorized); unparseable values fail the row like float() did
+        raw_ctc = df[cols["ctc"]] if cols["ctc"] else pd.Series([0] * len(df))
+        ctc = pd.to_numeric(raw_ctc, errors='coerce')
+        unparsed = ctc.isna() & raw_ctc.notna()
+
+        # Duplicates inside the file: every row after the first one that gets inserted
+        fresh = ~missing & ~in_db
+        positions = pd.Series(range(len(df)))
+        first_ok = positions[fresh & ~unparsed].groupby(emails[fresh & ~unparsed]).min()
+        in_file = fresh & (positions > emails.map(first_ok))
+
+        exists = in_db | in_file
+        for row, email in zip(row_numbers[exists], emails[exists]):
+            errors.append((row, f"Skipped {email}: Exists"))
+
+        bad_ctc = fresh & ~in_file & unparsed
+        for row, value in zip(row_numbers[bad_ctc], raw_ctc[bad_ctc]):
+            errors.append((row, f"Row {row}: could not convert string to float: {value!r}"))
+
+        keep = fresh & ~in_file & ~unparsed
+        ctc = ctc.fillna(0).astype(float)
+        basic = ctc * 0.5
+        hra = basic * 0.5
+        pf = basic * 0.12
+        special = (ctc - (basic + hra + pf)).clip(lower=0)
+
+        # 4. Joining Date
+        today = datetime.now().strftime("%Y-%m-%d")
+        if cols["joining_date"]:
+            # format="mixed" parses each cell on its own; the default infers one
+            # format from the first value and turns every other layout into NaT
+            joining = pd.to_datetime(df[cols["joining_date"]], errors='coerce', format="mixed").dt.strftime("%Y-%m-%d").fillna(today)
+        else:
+            joining = pd.Series([today] * len(df))
+
+        # 5. Basic Fields
+        values = {}
+        for field, default in FIELD_DEFAULTS.items():
+            col = cols[field]
+            values[field] = df[col].where(df[col].notna(), default) if col else pd.Series([default] * len(df))
+
+        # 6. IDs for rows that have none
+        if cols["emp_id"]:
+            emp_ids = df[cols["emp_id"]].astype(object)
+            emp_ids = emp_ids.where(emp_ids.notna() & (emp_ids.astype(str).str.strip() != ""), None)
+        else:
+            emp_ids = pd.Series([None] * len(df), dtype=object)
+        needs_id = keep & emp_ids.isna()
+        if needs_id.any():
+            emp_ids[needs_id] = emp_id_sequence.reserve_emp_ids(db, int(needs_id.sum()))
+
+        created_at = datetime.utcnow()
+        docs = [
+            {
+                "emp_id": str(emp_id),
+                "name": name,
+                "email": email,
+                "designation": desg,
+                "department": dept,
+                "joining_date": jd,
+                "location": location,
+                "employment_type": employment_type,
+                "status": "Pending",
+                "revision": 1,
+                "created_at": created_at,
+                "compensation": {
+                    "ctc": c,
+                    "basic_salary": round(b, 2),
+                    "hra": round(h, 2),
+                    "allowances": round(s, 2),
+                    "deductions": round(p + PROFESSIONAL_TAX, 2),
+                    "net_salary": c
+                }
+            }
+            for emp_id, name, email, desg, dept, jd, location, employment_type, c, b, h, s, p in zip(
+                emp_ids[keep].tolist(), values["name"][keep].tolist(), emails[keep].tolist(),
+                values["designation"][keep].tolist(), values["department"][keep].tolist(),
+                joining[keep].tolist(), values["location"][keep].tolist(),
+                values["employment_type"][keep].tolist(), ctc[keep].tolist(), basic[keep].tolist(),
+                hra[keep].tolist(), special[keep].tolist(), pf[keep].tolist()
+            )
+        ]
+
+        # Written in the current schema so reads don't need to sanitize them
+        for doc in docs:
+            to_set, to_unset = split_unset(normalize_company(doc))
+            doc.update(to_set)
+            for field in to_unset:
+                del doc[field]
+
+        # 7. Batched, unordered writes
+        imported, insert_errors = self.insert_docs(db, docs, row_numbers[keep].tolist())
+        errors.extend(insert_errors)
+
+        errors.sort(key=lambda e: e[0])
+        return imported, [message for _, message in errors]
+
+    def insert_docs(self, db, docs, row_numbers):
+        imported = 0
+        errors = []
+        for start in range(0, len(docs), self.batch_size):
+            batch = docs[start:start + self.batch_size]
+            try:
+                result = db.companies.insert_many(batch, ordered=False)
+                imported += len(result.inserted_ids)
+            except BulkWriteError as e:
+                imported += e.details.get("nInserted", 0)
+                for err in e.details.get("writeErrors", []):
+                    row = row_numbers[start + err["index"]]
+                    errors.append((row, f"Row {row}: {err.get('errmsg')}"))
+        return imported, errors
+
+    def iter_csv_chunks(self, path):
+        for chunk in pd.read_csv(path, chunksize=self.chunk_rows):
+            yield self.normalize_headers(chunk)
+
+    def iter_xlsx_chunks(self, path):
+        """
+        Reads the first sheet through openpyxl's read-only row iterator, so only one
+        chunk of rows is ever held in memory.
+        """
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(c).lower().strip().replace(' ', '_') for c in header]
+
+            buffer = []
+            for row in rows:
+                buffer.append(row)
+                if len(buffer) >= self.chunk_rows:
+                    yield pd.DataFrame(buffer, columns=columns)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=columns)
+        finally:
+            workbook.close()
+
+    def import_file(self, db, path, file_format, on_progress=None):
+        """
+        Streams a spooled CSV/XLSX file from disk and inserts it chunk by chunk.
+        `on_progress(processed, imported, errors)` is called after every chunk.
+        """
+        chunks = self.iter_xlsx_chunks(path) if file_format == "xlsx" else self.iter_csv_chunks(path)
+        cols = None
+        row_offset = 0
+        total_imported = 0
+
+        for chunk in chunks:
+            if cols is None:
+                cols = self.resolve_columns(chunk.columns)
+            imported, errors = self.import_frame(db, chunk, cols, row_offset)
+            row_offset += len(chunk)
+            total_imported += imported
+            if on_progress:
+                on_progress(len(chunk), imported, errors)
+
+        return total_imported
+
+
+# Singleton instance
+company_importer = ImportService()
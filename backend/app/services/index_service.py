@@ -0,0 +1,157 @@
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+from bson import ObjectId
+import json
+
+# Indexes every collection needs. Unique indexes are only built once the
+# collection has no duplicates for that key; until then a plain index is
+# kept so lookups stay indexed, and the duplicates are reported.
+# The unique keys only cover non-empty strings: $exists would still index
+# null and "" (the edit form sends emp_id: ''), so blank values would collide.
+INDEX_SPECS = {
+    "companies": [
+        {"keys": [("email", ASCENDING)], "name": "email_unique", "unique": True,
+         "partialFilterExpression": {"email": {"$type": "string", "$gt": ""}}},
+        {"keys": [("emp_id", ASCENDING)], "name": "emp_id_unique", "unique": True,
+         "partialFilterExpression": {"emp_id": {"$type": "string", "$gt": ""}}},
+        {"keys": [("status", ASCENDING), ("name", ASCENDING)], "name": "status_name"},
+        {"keys": [("status", ASCENDING), ("_id", ASCENDING)], "name": "status_id"},
+        {"keys": [("name", ASCENDING)], "name": "name"},
+        {"keys": [("compensation.percentage", ASCENDING)], "name": "percentage"},
+        {"keys": [("name", TEXT), ("email", TEXT), ("address", TEXT)], "name": "company_text"},
+        {"keys": [("created_at", DESCENDING)], "name": "created_at"},
+    ],
+    "generated_agreements": [
+        {"keys": [("employee_id", ASCENDING), ("generated_on", DESCENDING)], "name": "employee_history"},
+        {"keys": [("etag", ASCENDING)], "name": "etag"},
+        {"keys": [("employee_id", ASCENDING), ("_id", DESCENDING)], "name": "employee_history_page"},
+    ],
+    "jobs": [
+        {"keys": [("created_at", DESCENDING)], "name": "created_at"},
+        {"keys": [("status", ASCENDING), ("updated_at", ASCENDING)], "name": "status_updated_at"},
+    ],
+    "email_outbox": [
+        {"keys": [("status", ASCENDING), ("next_attempt_at", ASCENDING)], "name": "status_next_attempt"},
+        {"keys": [("status", ASCENDING), ("locked_until", ASCENDING)], "name": "status_locked_until"},
+    ],
+    "email_rate_limits": [
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "template_metadata": [
+        {"keys": [("content_hash", ASCENDING)], "name": "content_hash"},
+    ],
+}
+
+# The hot queries, as (label, collection, filter, sort)
+SAMPLE_ID = ObjectId("000000000000000000000000")
+HOT_QUERIES = [
+    ("company by email", "companies", {"email": "probe@example.com"}, None),
+    ("company by id", "companies", {"_id": SAMPLE_ID}, None),
+    ("company by emp_id", "companies", {"emp_id": "EMP001"}, None),
+    ("companies by status", "companies", {"status": "Pending"}, [("name", ASCENDING)]),
+    ("companies by name prefix", "companies", {"name": {"$regex": "^A"}}, [("name", ASCENDING)]),
+    ("companies page by status", "companies", {"status": "Pending", "_id": {"$gt": SAMPLE_ID}}, [("_id", ASCENDING)]),
+    ("companies by percentage", "companies", {"compensation.percentage": {"$gte": 5, "$lte": 10}}, None),
+    ("agreement history", "generated_agreements", {"employee_id": SAMPLE_ID}, [("generated_on", DESCENDING)]),
+]
+
+
+class IndexManager:
+    def find_duplicates(self, collection, field, match=None, limit=20):
+        pipeline = [
+            {"$match": match or {field: {"$exists": True}}},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}, "ids": {"$push": {"$toString": "$_id"}}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": limit},
+        ]
+        return [
+            {"value": str(d["_id"]), "count": d["count"], "ids": d["ids"]}
+            for d in collection.aggregate(pipeline, allowDiskUse=True)
+        ]
+
+    def ensure_indexes(self, db):
+        """
+        Creates any missing index from INDEX_SPECS. Safe to run on every startup.
+        Returns a report of created indexes, blocking duplicates and errors.
+        """
+        report = {"created": [], "duplicates": {}, "errors": []}
+
+        for collection_name, specs in INDEX_SPECS.items():
+            collection = db[collection_name]
+            existing = collection.index_information()
+
+            for spec in specs:
+                keys = spec["keys"]
+                options = {k: v for k, v in spec.items() if k != "keys"}
+                field = keys[0][0]
+
+                current = existing.get(options["name"])
+                if current and current.get("partialFilterExpression") == options.get("partialFilterExpression"):
+                    continue
+                # Otherwise the index is missing, or was built with an older filter and is rebuilt below
+
+                if spec.get("unique"):
+                    duplicates = self.find_duplicates(collection, field, options.get("partialFilterExpression"))
+                    if duplicates:
+                        # Keep lookups indexed while the data gets cleaned up
+                        report["duplicates"][f"{collection_name}.{field}"] = duplicates
+                        options = {"name": f"{field}_lookup"}
+                        if options["name"] in existing:
+                            continue
+
+                try:
+                    # Same keys under another name/uniqueness/filter (e.g. the fallback lookup index)
+                    for name, info in existing.items():
+                        if name != "_id_" and info["key"] == keys:
+                            collection.drop_index(name)
+                    collection.create_index(keys, **options)
+                    report["created"].append(f"{collection_name}.{options['name']}")
+                except OperationFailure as e:
+                    report["errors"].append(f"{collection_name}.{options['name']}: {e}")
+
+        return report
+
+    def _stages(self, plan):
+        stages = []
+        if isinstance(plan, dict):
+            if "stage" in plan:
+                stages.append(plan["stage"])
+            for value in plan.values():
+                stages.extend(self._stages(value))
+        elif isinstance(plan, list):
+            for value in plan:
+                stages.extend(self._stages(value))
+        return stages
+
+    def explain_queries(self, db):
+        """
+        Runs explain() on the hot queries and flags any whose winning plan is a COLLSCAN.
+        """
+        results = []
+        for label, collection_name, query, sort in HOT_QUERIES:
+            cursor = db[collection_name].find(query).limit(50)
+            if sort:
+                cursor = cursor.sort(sort)
+            plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+            stages = self._stages(plan)
+            results.append({
+                "query": label,
+                "collection": collection_name,
+                "stages": stages,
+                "collection_scan": "COLLSCAN" in stages
+            })
+        return results
+
+
+# Singleton instance
+index_manager = IndexManager()
+
+
+if __name__ == "__main__":
+    # CLI: python -m app.services.index_service
+    from .. import database
+    db = database.connect()
+    print(json.dumps(index_manager.ensure_indexes(db), indent=2))
+    for result in index_manager.explain_queries(db):
+        flag = "COLLSCAN!" if result["collection_scan"] else "ok"
+        print(f"{flag:10} {result['query']:28} {' <- '.join(result['stages'])}")
@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from bson import ObjectId
+import os
+
+
+class JobService:
+    """
+    Runs long bulk operations on a bounded worker pool and tracks their progress
+    in the `jobs` collection, so any API worker can report on them via GET /jobs/{id}.
+    The pool lives in the API process: a job whose process restarts stops reporting
+    progress and is failed once it has been silent for JOB_STALE_SECONDS.
+    """
+    def __init__(self):
+        self.max_workers = int(os.getenv("BULK_WORKERS", "4"))
+        self.stale_after = int(os.getenv("JOB_STALE_SECONDS", "900"))
+        # Row errors kept on the job document; the rest are only counted (error_count)
+        self.max_errors = int(os.getenv("JOB_MAX_ERRORS", "1000"))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bulk-job")
+
+    def create_job(self, db, kind, item_keys, params=None):
+        job = {
+            "kind": kind,
+            "status": "queued",
+            "params": params or {},
+            "total": len(item_keys),
+            "processed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "items": [{"key": key, "status": "pending", "message": None} for key in item_keys],
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+            "finished_at": None
+        }
+        result = db.jobs.insert_one(job)
+        job["_id"] = result.inserted_id
+        return job
+
+    def submit(self, db, job, handler):
+        """
+        Fans the job's items out over the pool. `handler(key)` does the work for one
+        item and returns a message; raising marks the item as failed.
+        """
+        if not job["items"]:
+            self._finish(db, job["_id"])
+            return
+
+        db.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "running"}})
+        for index, item in enumerate(job["items"]):
+            self.executor.submit(self._run_item, db, job["_id"], index, item["key"], handler)
+
+    def _run_item(self, db, job_id, index, key, handler):
+        try:
+            message = handler(key)
+            self.record_item(db, job_id, index, "success", message)
+        except Exception as e:
+            print(f"Job {job_id} item {key} failed: {e}")
+            self.record_item(db, job_id, index, "error", str(e))
+
+    def record_item(self, db, job_id, index, status, message=None):
+        counter = "succeeded" if status == "success" else "failed"
+        job = db.jobs.find_one_and_update(
+            {"_id": job_id},
+            {
+                "$set": {
+                    f"items.{index}.status": status,
+                    f"items.{index}.message": message,
+                    "updated_at": datetime.utcnow()
+                },
+                "$inc": {"processed": 1, counter: 1}
+            },
+            projection={"processed": 1, "total": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if job and job["processed"] >= job["total"]:
+            self._finish(db, job_id)
+
+    def run_task(self, db, job, task):
+        """
+        Runs a single long task (e.g. a file import) on the pool. `task(job_id)` reports
+        its own progress through record_progress; raising marks the whole job as failed.
+        """
+        db.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "running"}})
+        self.executor.submit(self._run_task, db, job["_id"], task)
+
+    def _run_task(self, db, job_id, task):
+        try:
+            task(job_id)
+            self._finish(db, job_id)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._finish(db, job_id, status="failed", error=str(e))
+
+    def record_progress(self, db, job_id, processed=0, succeeded=0, failed=0, errors=None):
+        update = {
+            "$set": {"updated_at": datetime.utcnow()},
+            "$inc": {"total": processed, "processed": processed, "succeeded": succeeded, "failed": failed,
+                     "error_count": len(errors or [])}
+        }
+        if errors:
+            # Capped so a sheet full of bad rows can't push the job past the 16 MB document limit
+            update["$push"] = {"errors": {"$each": errors[:self.max_errors], "$slice": self.max_errors}}
+        db.jobs.update_one({"_id": job_id}, update)
+
+    def _finish(self, db, job_id, status="completed", error=None):
+        db.jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "error": error, "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
+        )
+
+    def _stale_filter(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        return {"status": {"$in": ["queued", "running"]}, "updated_at": {"$lt": cutoff}}
+
+    def _stale_update(self):
+        now = datetime.utcnow()
+        return {"$set": {"status": "failed", "error": "Job stopped reporting progress (server restarted?)",
+                         "finished_at": now, "updated_at": now}}
+
+    def fail_stale_jobs(self, db):
+        """Fails queued/running jobs that stopped reporting progress. Returns how many."""
+        return db.jobs.update_many(self._stale_filter(), self._stale_update()).modified_count
+
+    def get_job(self, db, job_id):
+        if not ObjectId.is_valid(job_id):
+            return None
+        job = db.jobs.find_one({"_id": ObjectId(job_id)})
+        if job and job["status"] in ("queued", "running") and \
+                job["updated_at"] < datetime.utcnow() - timedelta(seconds=self.stale_after):
+            # Its worker is gone; don't leave the client polling forever
+            job = db.jobs.find_one_and_update(
+                {"_id": job["_id"], **self._stale_filter()}, self._stale_update(),
+                return_document=ReturnDocument.AFTER
+            ) or db.jobs.find_one({"_id": job["_id"]})
+        return job
+
+
+# Singleton instance
+job_runner = JobService()
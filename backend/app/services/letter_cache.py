@@ -0,0 +1,43 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import os
+
+
+class LetterCache:
+    """
+    Bounded LRU of rendered letters keyed on everything that changes their text:
+    company id and revision, letter type, issuing company name, the template's own
+    type and version and the render date (letters fall back to today's date). The ETag is derived
+    from the key, so a client can revalidate without the server rendering anything.
+    """
+    def __init__(self, max_size=None):
+        self.max_size = max_size or int(os.getenv("LETTER_CACHE_SIZE", "256"))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(key):
+        return hashlib.sha1("|".join(map(str, key)).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+            return content
+
+    def put(self, key, content):
+        with self._lock:
+            self._entries[key] = content
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Singleton instance
+letter_cache = LetterCache()
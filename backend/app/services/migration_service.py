@@ -0,0 +1,103 @@
+from datetime import datetime
+from pymongo import UpdateOne, ASCENDING
+from .. import schemas
+from ..normalization import normalize_company, split_unset, UNSET
+
+
+class MigrationService:
+    """
+    Versioned, resumable data migrations for MongoDB.
+    Progress lives in the `migrations` collection: each migration records the last
+    _id it finished, so an interrupted run picks up from that batch.
+    """
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.migrations = [] # (version, name, collection, query, transform)
+
+    def register(self, version, name, collection, query):
+        def decorator(transform):
+            self.migrations.append((version, name, collection, query, transform))
+            self.migrations.sort(key=lambda m: m[0])
+            return transform
+        return decorator
+
+    def status(self, db):
+        done = {m["_id"]: m for m in db.migrations.find()}
+        return [
+            {"version": version, "name": name, "status": done.get(version, {}).get("status", "pending"),
+             "processed": done.get(version, {}).get("processed", 0)}
+            for version, name, _, _, _ in self.migrations
+        ]
+
+    def run(self, db, log=print):
+        for version, name, collection, query, transform in self.migrations:
+            state = db.migrations.find_one({"_id": version}) or {}
+            if state.get("status") == "done":
+                continue
+
+            log(f"Running migration {version}: {name}")
+            db.migrations.update_one(
+                {"_id": version},
+                {"$set": {"name": name, "status": "running"}, "$setOnInsert": {"started_at": datetime.utcnow(), "processed": 0}},
+                upsert=True
+            )
+            processed = self._run_batched(db, version, db[collection], query, transform, state.get("last_id"), log)
+            db.migrations.update_one(
+                {"_id": version},
+                {"$set": {"status": "done", "finished_at": datetime.utcnow()}}
+            )
+            log(f"Migration {version} done ({processed} documents updated this run)")
+
+    def _run_batched(self, db, version, collection, query, transform, last_id, log):
+        processed = 0
+        while True:
+            batch_query = dict(query)
+            if last_id is not None:
+                batch_query["_id"] = {"$gt": last_id}
+            docs = list(collection.find(batch_query).sort("_id", ASCENDING).limit(self.batch_size))
+            if not docs:
+                return processed
+
+            ops = []
+            for doc in docs:
+                updates = transform(doc)
+                if updates:
+                    to_set, to_unset = split_unset(updates)
+                    update = {"$set": to_set, "$inc": {"revision": 1}}
+                    if to_unset:
+                        update["$unset"] = to_unset
+                    ops.append(UpdateOne({"_id": doc["_id"]}, update))
+            if ops:
+                collection.bulk_write(ops, ordered=False)
+
+            # Checkpoint after every batch so a crash resumes here
+            last_id = docs[-1]["_id"]
+            processed += len(ops)
+            db.migrations.update_one(
+                {"_id": version},
+                {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()}, "$inc": {"processed": len(ops)}}
+            )
+            log(f"  ...{processed} documents")
+
+
+# Singleton instance
+migration_runner = MigrationService()
+
+
+@migration_runner.register(
+    1, "normalize_legacy_companies", "companies",
+    {"$or": [{"schema_version": {"$exists": False}}, {"schema_version": {"$lt": schemas.COMPANY_SCHEMA_VERSION}}]}
+)
+def normalize_legacy_companies(doc):
+    return normalize_company(doc)
+
+
+@migration_runner.register(2, "drop_placeholder_emails", "companies", {"email": {"$regex": r"@imported\.local$"}})
+def drop_placeholder_emails(doc):
+    # Version 1 stored unknown@imported.local / <phone>@imported.local placeholders,
+    # which block the unique email index as soon as two companies share one
+    local = doc["email"].split("@")[0]
+    updates = {"email": UNSET}
+    if local.isdigit():
+        updates["legacy_email"] = int(local)
+    return updates
@@ -0,0 +1,239 @@
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, ASCENDING
+from bson import ObjectId
+from .email_service import email_client
+import threading
+import random
+import time
+import os
+
+
+class OutboxService:
+    """
+    Durable email outbox. POST /email/send, /email/send-batch and /letters/bulk only
+    insert messages into the `email_outbox` collection; background workers claim
+    messages, send them, retry with exponential backoff and dead-letter them after
+    too many failures. The company's status only moves to "Agreement Sent" once
+    delivery succeeded.
+
+    Every API process runs its own workers, so the provider quota is enforced
+    across processes with a per-minute counter in `email_rate_limits`.
+    """
+    def __init__(self):
+        self.workers = int(os.getenv("EMAIL_WORKERS", "2"))
+        self.max_attempts = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+        self.base_delay = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+        self.lease = timedelta(minutes=5) # a crashed worker's message is retried after this
+        self.poll_interval = 2
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    def enqueue(self, db, employee_id, recipient_email, candidate_name, letter_content=None,
+                pdf_content=None, email_body=None, subject=None, company_name="Arah Infotech Pvt Ltd"):
+        now = datetime.utcnow()
+        message = {
+            "employee_id": ObjectId(employee_id),
+            "recipient_email": recipient_email,
+            "candidate_name": candidate_name,
+            "letter_content": letter_content,
+            "pdf_content": pdf_content,
+            "email_body": email_body,
+            "subject": subject,
+            "company_name": company_name,
+            "provider": email_client.provider,
+            "status": "pending",
+            "attempts": 0,
+            "last_error": None,
+            "next_attempt_at": now,
+            "locked_until": None,
+            "created_at": now,
+            "sent_at": None
+        }
+        result = db.email_outbox.insert_one(message)
+        self._wake.set()
+        return result.inserted_id
+
+    def enqueue_batch(self, db, recipients, subject, body, company_name="Arah Infotech Pvt Ltd"):
+        """
+        Queues the same message (no attachment) for many recipients ({"employee_id",
+        "email", "name"}). On Brevo each queued message is one API call for up to
+        BREVO_BATCH_LIMIT recipients; over SMTP every recipient is its own message.
+        Returns the outbox id for each recipient, in order.
+        """
+        now = datetime.utcnow()
+        size = email_client.BREVO_BATCH_LIMIT if email_client.provider == "brevo" else 1
+        messages = [
+            {
+                "kind": "batch",
+                "recipients": recipients[start:start + size],
+                "email_body": body,
+                "subject": subject,
+                "company_name": company_name,
+                "provider": email_client.provider,
+                "status": "pending",
+                "attempts": 0,
+                "last_error": None,
+                "results": [],
+                "next_attempt_at": now,
+                "locked_until": None,
+                "created_at": now,
+                "sent_at": None
+            }
+            for start in range(0, len(recipients), size)
+        ]
+        if not messages:
+            return []
+        ids = db.email_outbox.insert_many(messages).inserted_ids
+        self._wake.set()
+        return [message_id for message_id, message in zip(ids, messages) for _ in message["recipients"]]
+
+    def get(self, db, message_id):
+        if not ObjectId.is_valid(message_id):
+            return None
+        return db.email_outbox.find_one({"_id": ObjectId(message_id)}, {"pdf_content": 0, "letter_content": 0})
+
+    def start(self, db):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(db,), name=f"email-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+
+    def _claim(self, db):
+        now = datetime.utcnow()
+        return db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "locked_until": {"$lte": now}} # abandoned by a dead worker
+            ]},
+            {"$set": {"status": "sending", "locked_until": now + self.lease}},
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _work(self, db):
+        while not self._stop.is_set():
+            try:
+                message = self._claim(db)
+            except Exception as e:
+                print(f"Outbox claim failed: {e}")
+                message = None
+
+            if message is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            try:
+                self._deliver(db, message)
+            except Exception as e:
+                # e.g. Mongo unavailable; the message is retried once its lease expires
+                print(f"Outbox delivery of {message['_id']} failed: {e}")
+
+    def _throttle(self, db, provider):
+        """
+        Waits for a slot in the provider's per-minute quota, counted in Mongo so every
+        API process shares it (the in-process RateLimiter only paces one process).
+        """
+        limit = email_client.rate_limits[provider].per_minute
+        while not self._stop.is_set():
+            window = int(time.time() // 60)
+            key = f"{provider}:{window}"
+            counter = db.email_rate_limits.find_one_and_update(
+                {"_id": key},
+                {"$inc": {"sent": 1}, "$setOnInsert": {"expires_at": datetime.utcnow() + timedelta(minutes=5)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            if counter["sent"] <= limit:
+                return True
+            db.email_rate_limits.update_one({"_id": key}, {"$inc": {"sent": -1}})
+            self._stop.wait(60 - time.time() % 60 + random.uniform(0, 1))
+        return False # shutting down; the message is retried once its lease expires
+
+    def _deliver(self, db, message):
+        if not self._throttle(db, email_client.provider):
+            return
+        if message.get("kind") == "batch":
+            return self._deliver_batch(db, message)
+        try:
+            result = email_client.send_offer_letter(
+                recipient_email=message["recipient_email"],
+                candidate_name=message["candidate_name"],
+                letter_content=message.get("letter_content"),
+                pdf_content=message.get("pdf_content"),
+                email_body=message.get("email_body"),
+                subject=message.get("subject"),
+                company_name=message.get("company_name")
+            )
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+
+        now = datetime.utcnow()
+        if result.get("status") == "success":
+            db.email_outbox.update_one(
+                {"_id": message["_id"]},
+                {"$set": {"status": "sent", "sent_at": now, "locked_until": None, "last_error": None},
+                 "$inc": {"attempts": 1}, "$unset": {"pdf_content": ""}}
+            )
+            db.companies.update_one(
+                {"_id": message["employee_id"]},
+                {"$set": {"status": "Agreement Sent"}, "$inc": {"revision": 1}}
+            )
+            return
+
+        self._failed(db, message, result.get("message"))
+
+    def _deliver_batch(self, db, message):
+        recipients = message["recipients"]
+        try:
+            results = email_client.send_batch(recipients, message["subject"], message["email_body"],
+                                              company_name=message.get("company_name"))
+        except Exception as e:
+            results = [{"email": r["email"], "status": "error", "message": str(e)} for r in recipients]
+
+        delivered = [{"employee_id": r["employee_id"], **result}
+                     for r, result in zip(recipients, results) if result.get("status") == "success"]
+        failed = [(r, result) for r, result in zip(recipients, results) if result.get("status") != "success"]
+        if delivered:
+            db.email_outbox.update_one({"_id": message["_id"]}, {"$push": {"results": {"$each": delivered}}})
+
+        if not failed:
+            db.email_outbox.update_one(
+                {"_id": message["_id"]},
+                {"$set": {"status": "sent", "sent_at": datetime.utcnow(), "locked_until": None, "last_error": None},
+                 "$inc": {"attempts": 1}}
+            )
+            return
+
+        # Only the recipients that failed are retried
+        self._failed(db, message, failed[0][1].get("message"), {"recipients": [r for r, _ in failed]})
+
+    def _failed(self, db, message, error, extra=None):
+        now = datetime.utcnow()
+        attempts = message.get("attempts", 0) + 1
+        if attempts >= self.max_attempts:
+            update = {"status": "dead", "locked_until": None}
+            print(f"Outbox message {message['_id']} dead-lettered after {attempts} attempts: {error}")
+        else:
+            # Exponential backoff with a little jitter: 30s, 60s, 120s, ...
+            delay = self.base_delay * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            update = {"status": "pending", "locked_until": None, "next_attempt_at": now + timedelta(seconds=delay)}
+
+        update["last_error"] = error
+        update.update(extra or {})
+        db.email_outbox.update_one({"_id": message["_id"]}, {"$set": update, "$inc": {"attempts": 1}})
+
+
+# Singleton instance
+email_outbox = OutboxService()
@@ -0,0 +1,350 @@
+import fitz  # PyMuPDF
+import io
+import re
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# backend/app/services/pdf_service.py -> services -> app -> backend -> ROOT -> public
+BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
+PUBLIC_DIR = BASE_DIR / "public"
+
+# Same layouts as TEMPLATE_CONFIG in src/utils/pdfTemplateGenerator.js
+TEMPLATE_CONFIG = {
+    '/Arah_Template.pdf': {
+        "pageW": 612, "pageH": 792, "marginTop": 111, "marginBottom": 57, "marginLR": 50,
+        "watermark": 'ARAH INFOTECH'
+    },
+    '/Vagerious.pdf': {
+        "pageW": 595, "pageH": 842, "marginTop": 140, "marginBottom": 104, "marginLR": 50,
+        "watermark": 'VAGARIOUS'
+    },
+    '/UPlife.pdf': {
+        "pageW": 596, "pageH": 842, "marginTop": 99, "marginBottom": 78, "marginLR": 50,
+        "watermark": 'UP LIFE INDIA'
+    },
+    '/Zero7_A4.pdf': {
+        "pageW": 595, "pageH": 842, "marginTop": 140, "marginBottom": 101, "marginLR": 50,
+        "watermark": 'ZERO7'
+    },
+    '/Zero7_A4.jpg': {
+        "pageW": 595, "pageH": 842, "marginTop": 140, "marginBottom": 101, "marginLR": 50,
+        "watermark": 'ZERO7'
+    },
+}
+
+DEFAULT_LAYOUT = {"pageW": 612, "pageH": 792, "marginTop": 110, "marginBottom": 60, "marginLR": 50}
+
+AGREEMENT_CSS = """
+* { font-family: sans-serif; }
+body { font-size: 11px; line-height: 1.5; text-align: justify; }
+h3 { font-size: 13px; }
+h4 { font-size: 12px; margin-top: 14px; }
+ul { margin-top: 4px; margin-bottom: 4px; }
+td { vertical-align: top; }
+"""
+
+# Outer container div the agreement template wraps everything in
+WRAPPER_PATTERN = re.compile(r'^\s*<div style="[^"]*">([\s\S]*)</div>\s*$')
+# Numbered sections that must not be split from their heading (see letter_templates/agreement.html)
+SECTION_PATTERN = re.compile(r'<div class="section-block">[\s\S]*?</div>')
+
+# Blue header strip that the frontend also strips before stamping onto a letterhead
+HEADER_PATTERN = re.compile(r'<div style="text-align: center; border-bottom: 2px solid #0056b3;[\s\S]*?</div>', re.IGNORECASE)
+
+
+class TemplateNotFoundError(ValueError):
+    """A letterhead was asked for but no such file exists under public/."""
+
+
+class CachedTemplate:
+    """A letterhead parsed once: background document/image plus its page geometry."""
+    def __init__(self, content_hash, path, layout):
+        self.content_hash = content_hash
+        self.layout = layout
+        self.page_rect = fitz.Rect(0, 0, layout["pageW"], layout["pageH"])
+        self.content_rect = fitz.Rect(
+            layout["marginLR"], layout["marginTop"],
+            layout["pageW"] - layout["marginLR"], layout["pageH"] - layout["marginBottom"]
+        )
+        self.doc = None
+        self.image = None
+        if path is None:
+            return
+        if path.suffix.lower() == ".pdf":
+            self.doc = fitz.open(path)
+        else:
+            self.image = path.read_bytes()
+
+    def close(self):
+        if self.doc is not None:
+            self.doc.close()
+
+
+class TemplateCache:
+    """
+    Process-level LRU of parsed letterheads keyed by file content hash, so N renders on
+    one letterhead parse it once. A (mtime, size) check per path avoids re-hashing the
+    file on every render; upload routes call invalidate() when they replace a file.
+    """
+    def __init__(self, max_size=None):
+        self.max_size = max_size or int(os.getenv("TEMPLATE_CACHE_SIZE", "8"))
+        self._by_hash = OrderedDict()
+        self._hash_by_path = {} # path -> (mtime, size, content_hash)
+        self._lock = threading.RLock()
+
+    def _content_hash(self, path):
+        stat = path.stat()
+        known = self._hash_by_path.get(path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        self._hash_by_path[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def content_hash(self, path):
+        with self._lock:
+            return self._content_hash(Path(path).resolve())
+
+    def get(self, path, layout):
+        with self._lock:
+            # analyzed layouts carry [x0, y0, x1, y1] boxes, which aren't hashable
+            layout_key = tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in sorted(layout.items()))
+            key = (self._content_hash(path) if path else "blank", layout_key)
+            entry = self._by_hash.get(key)
+            if entry is not None:
+                self._by_hash.move_to_end(key)
+                return entry
+
+            entry = CachedTemplate(key[0], path, layout)
+            self._by_hash[key] = entry
+            while len(self._by_hash) > self.max_size:
+                _, evicted = self._by_hash.popitem(last=False)
+                evicted.close()
+            return entry
+
+    def invalidate(self, path):
+        with self._lock:
+            known = self._hash_by_path.pop(Path(path).resolve(), None)
+            if known is None:
+                return
+            for key in [k for k in self._by_hash if k[0] == known[2]]:
+                self._by_hash.pop(key).close()
+
+    def clear(self):
+        with self._lock:
+            for entry in self._by_hash.values():
+                entry.close()
+            self._by_hash.clear()
+            self._hash_by_path.clear()
+
+
+class PDFService:
+    def __init__(self):
+        self.templates = TemplateCache()
+        self._layouts = {} # content hash -> analyzed layout
+        # MuPDF is not safe for concurrent use of shared documents; renders share cached templates
+        self._render_lock = threading.Lock()
+
+    def get_layout(self, template_url, path=None):
+        """
+        Hand-tuned layouts win; any other uploaded letterhead uses the metrics
+        analyzed from the file itself (once per content hash).
+        """
+        if template_url in TEMPLATE_CONFIG:
+            return TEMPLATE_CONFIG[template_url]
+        if path is None:
+            path = self.resolve_template(template_url)
+        if path is None:
+            return DEFAULT_LAYOUT
+        content_hash = self.templates.content_hash(path)
+        if content_hash not in self._layouts:
+            self._layouts[content_hash] = self.analyze_layout(path)
+        return self._layouts[content_hash]
+
+    def analyze_layout(self, path, padding=8, band=0.35):
+        """
+        Measures a letterhead's first page: the page box, how far the header artwork
+        reaches down and the footer reaches up, and the free content rectangle between.
+        Vector drawings, text and images are used when the page has them; full-page
+        scans/images (and JPG templates) fall back to scanning a low-res raster for ink.
+        """
+        doc = fitz.open(path)
+        try:
+            page = doc[0]
+            rect = page.rect
+            header_bottom, footer_top, source = self._vector_extents(page, band)
+            if header_bottom is None and footer_top is None:
+                header_bottom, footer_top = self._raster_extents(page, band)
+                source = "raster"
+        finally:
+            doc.close()
+
+        margin_top = (header_bottom + padding) if header_bottom is not None else DEFAULT_LAYOUT["marginTop"]
+        margin_bottom = (rect.height - footer_top + padding) if footer_top is not None else DEFAULT_LAYOUT["marginBottom"]
+        margin_lr = DEFAULT_LAYOUT["marginLR"]
+        return {
+            "pageW": round(rect.width, 2),
+            "pageH": round(rect.height, 2),
+            "marginTop": round(margin_top, 2),
+            "marginBottom": round(margin_bottom, 2),
+            "marginLR": margin_lr,
+            "header": [0, 0, round(rect.width, 2), round(header_bottom or 0, 2)],
+            "footer": [0, round(footer_top if footer_top is not None else rect.height, 2), round(rect.width, 2), round(rect.height, 2)],
+            "content": [margin_lr, round(margin_top, 2), round(rect.width - margin_lr, 2), round(rect.height - margin_bottom, 2)],
+            "source": source,
+        }
+
+    def _vector_extents(self, page, band):
+        rect = page.rect
+        boxes = [fitz.Rect(d["rect"]) for d in page.get_drawings()]
+        boxes += [fitz.Rect(b[:4]) for b in page.get_text("blocks")]
+        boxes += [fitz.Rect(i["bbox"]) for i in page.get_image_info()]
+
+        # Ignore full-page backgrounds and big centred watermarks
+        max_area = rect.width * rect.height * 0.25
+        boxes = [b & rect for b in boxes]
+        boxes = [b for b in boxes if not b.is_empty and b.get_area() <= max_area]
+
+        header = [b.y1 for b in boxes if b.y1 <= rect.height * band]
+        footer = [b.y0 for b in boxes if b.y0 >= rect.height * (1 - band)]
+        return (max(header) if header else None), (min(footer) if footer else None), "vector"
+
+    def _raster_extents(self, page, band, dpi=36, ink=200, min_fraction=0.01):
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        width, height, samples = pix.width, pix.height, pix.samples
+        scale = page.rect.height / height
+
+        def has_ink(y):
+            row = samples[y * pix.stride:y * pix.stride + width]
+            return sum(1 for value in row if value < ink) > width * min_fraction
+
+        header_rows = [y for y in range(int(height * band)) if has_ink(y)]
+        footer_rows = [y for y in range(int(height * (1 - band)), height) if has_ink(y)]
+        header_bottom = (max(header_rows) + 1) * scale if header_rows else None
+        footer_top = min(footer_rows) * scale if footer_rows else None
+        return header_bottom, footer_top
+
+    def resolve_template(self, template_url):
+        """
+        Maps a root-relative template URL (e.g. '/Arah_Template.pdf') to the file in public/.
+        Returns None if the template does not exist or points outside public/.
+        """
+        if not template_url:
+            return None
+        path = (PUBLIC_DIR / template_url.lstrip("/")).resolve()
+        if PUBLIC_DIR.resolve() not in path.parents or not path.exists():
+            return None
+        return path
+
+    def render_agreement(self, html_content, template_url='/Arah_Template.pdf'):
+        """
+        Renders agreement HTML as text onto the letterhead template and returns the PDF bytes.
+        Without a template_url the page is blank; an unknown one raises TemplateNotFoundError
+        rather than quietly sending an agreement without its letterhead.
+        """
+        path = self.resolve_template(template_url)
+        if template_url and path is None:
+            raise TemplateNotFoundError(f"Letterhead template '{template_url}' not found")
+        cfg = self.get_layout(template_url, path)
+        with self._render_lock:
+            template = self.templates.get(path, cfg)
+
+            # 1. Lay the blocks out as real text inside the content box
+            buffer = io.BytesIO()
+            writer = fitz.DocumentWriter(buffer)
+            self._layout(writer, self.split_blocks(html_content), template.page_rect, template.content_rect)
+            writer.close()
+
+            # 2. Put the (already parsed) letterhead underneath every page
+            doc = fitz.open("pdf", buffer.getvalue())
+            for page in doc:
+                if template.doc is not None:
+                    page.show_pdf_page(page.rect, template.doc, 0, overlay=False)
+                elif template.image is not None:
+                    page.insert_image(page.rect, stream=template.image, overlay=False)
+
+                if cfg.get("watermark"):
+                    self._draw_watermark(page, cfg["watermark"])
+
+            pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+            doc.close()
+        return pdf_bytes
+
+    def split_blocks(self, html_content):
+        """
+        Splits the agreement into (keep_together, html) blocks: each section-block is
+        one unit, everything between sections flows freely.
+        """
+        html_content = HEADER_PATTERN.sub('', html_content)
+        match = WRAPPER_PATTERN.match(html_content)
+        inner = match.group(1) if match else html_content
+
+        blocks = []
+        pos = 0
+        for section in SECTION_PATTERN.finditer(inner):
+            if inner[pos:section.start()].strip():
+                blocks.append((False, inner[pos:section.start()]))
+            blocks.append((True, section.group(0)))
+            pos = section.end()
+        if inner[pos:].strip():
+            blocks.append((False, inner[pos:]))
+        return blocks
+
+    def _layout(self, writer, blocks, page_rect, content_rect):
+        """
+        Places the blocks one after another. A section-block that does not fit in
+        what is left of the page moves to the next page as a whole, so a heading is
+        never left orphaned at the bottom (the frontend's page-break rule).
+        """
+        page = {"device": None, "y": content_rect.y0}
+
+        def new_page():
+            if page["device"] is not None:
+                writer.end_page()
+            page["device"] = writer.begin_page(page_rect)
+            page["y"] = content_rect.y0
+
+        new_page()
+        for keep_together, html in blocks:
+            if content_rect.y1 - page["y"] < 12:
+                new_page()
+
+            where = fitz.Rect(content_rect.x0, page["y"], content_rect.x1, content_rect.y1)
+            story = fitz.Story(html=html, user_css=AGREEMENT_CSS)
+            more, filled = story.place(where)
+
+            if more and keep_together and page["y"] > content_rect.y0:
+                new_page()
+                story = fitz.Story(html=html, user_css=AGREEMENT_CSS)
+                more, filled = story.place(content_rect)
+
+            story.draw(page["device"])
+            # Longer than a whole page (or a free-flowing block): continue on the next pages
+            while more:
+                new_page()
+                more, filled = story.place(content_rect)
+                story.draw(page["device"])
+            page["y"] = fitz.Rect(filled).y1
+
+        writer.end_page()
+
+    def _draw_watermark(self, page, text, font_size=60):
+        # Faint diagonal text across the centre of the page, like the frontend generator
+        width = fitz.get_text_length(text, fontname="helv", fontsize=font_size)
+        center = fitz.Point(page.rect.width / 2, page.rect.height / 2)
+        origin = fitz.Point(center.x - width / 2, center.y + font_size / 3)
+        morph = (center, fitz.Matrix(-45))
+        page.insert_text(origin, text, fontsize=font_size, fontname="helv",
+                         color=(0.75, 0.75, 0.75), fill_opacity=0.06, morph=morph)
+
+
+# Singleton instance
+pdf_renderer = PDFService()
+
+
+def render_agreement(html_content, template_url='/Arah_Template.pdf'):
+    """Module-level entry point so renders can run in a worker process."""
+    return pdf_renderer.render_agreement(html_content, template_url)
@@ -0,0 +1,73 @@
+from pathlib import Path
+import asyncio
+import threading
+import os
+from .process_pool import process_pool
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
+PREVIEW_DIR = BASE_DIR / "public" / "previews"
+
+# name -> (target width in px, dpi); print keeps the old 300 DPI fallback quality
+PREVIEW_SIZES = {
+    "thumbnail": (240, None),
+    "screen": (1240, None),
+    "print": (None, 300),
+}
+
+
+def _rasterize(source, target, width=None, dpi=None):
+    """Renders the first page of `source` to a JPG. Runs inside a worker process."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(source)
+    try:
+        page = doc.load_page(0)
+        zoom = width / page.rect.width if width else dpi / 72
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        partial = f"{target}.{os.getpid()}.part"
+        pix.save(partial, output="jpg")
+        os.replace(partial, target) # readers never see a half-written preview
+    finally:
+        doc.close()
+    return target
+
+
+class PreviewService:
+    """
+    Template previews rendered lazily, once per (content hash, size), on the shared
+    process pool so rasterizing a letterhead never blocks the event loop or holds the GIL.
+    Concurrent requests for the same preview share one render.
+    """
+    def __init__(self):
+        self._inflight = {} # (content_hash, size) -> Future
+        self._lock = threading.Lock()
+
+    def path_for(self, content_hash, size):
+        return PREVIEW_DIR / f"{content_hash}_{size}.jpg"
+
+    async def get(self, source, content_hash, size):
+        if size not in PREVIEW_SIZES:
+            raise ValueError(f"Unknown preview size '{size}'")
+        target = self.path_for(content_hash, size)
+        if target.exists():
+            return target
+
+        key = (content_hash, size)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                PREVIEW_DIR.mkdir(parents=True, exist_ok=True)
+                width, dpi = PREVIEW_SIZES[size]
+                future = process_pool.executor.submit(_rasterize, str(source), str(target), width, dpi)
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+        await asyncio.wrap_future(future)
+        return target
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+
+# Singleton instance
+template_previews = PreviewService()
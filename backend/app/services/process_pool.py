@@ -0,0 +1,41 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+import os
+
+
+class ProcessPool:
+    """
+    The one process pool for CPU-bound work: template previews, DOCX builds and
+    export renders share PROCESS_WORKERS workers.
+
+    Workers are spawned, not forked. The API process holds Mongo clients, the
+    outbox and bulk-job threads and pdf_renderer's render lock, and a forked
+    child gets a copy of any lock another thread held at that moment, which
+    nothing ever releases (render_agreement would hang on it). The pool is
+    created on first use, so importing the app starts no processes.
+    """
+    def __init__(self):
+        self.max_workers = int(os.getenv("PROCESS_WORKERS", "2"))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# Singleton instance
+process_pool = ProcessPool()
@@ -0,0 +1,54 @@
+from pymongo import ReturnDocument
+
+
+class SequenceService:
+    """
+    Hands out emp_ids from the `counters` collection with an atomic $inc,
+    so concurrent creates/imports never get the same number and deletes never
+    cause an id to be reused.
+    """
+    def __init__(self, prefix="EMP"):
+        self.prefix = prefix
+        self._seeded = set()
+
+    def _seed(self, db, name):
+        # First use against an existing collection: start after the highest EMPnnn already issued.
+        if name in self._seeded:
+            return
+        if db.counters.find_one({"_id": name}) is None:
+            highest = 0
+            cursor = db.companies.find({"emp_id": {"$regex": f"^{self.prefix}[0-9]+$"}}, {"emp_id": 1, "_id": 0})
+            for doc in cursor:
+                highest = max(highest, int(doc["emp_id"][len(self.prefix):]))
+            # $max keeps this safe if another worker seeds (or allocates) at the same time
+            db.counters.update_one({"_id": name}, {"$max": {"value": highest}}, upsert=True)
+        self._seeded.add(name)
+
+    def reserve(self, db, count=1, name="emp_id"):
+        """
+        Reserves a block of `count` consecutive numbers in one round trip.
+        """
+        if count <= 0:
+            return range(0)
+        self._seed(db, name)
+        counter = db.counters.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"value": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        end = counter["value"]
+        return range(end - count + 1, end + 1)
+
+    def format(self, number):
+        return f"{self.prefix}{number:03d}"
+
+    def next_emp_id(self, db):
+        return self.format(self.reserve(db, 1)[0])
+
+    def reserve_emp_ids(self, db, count):
+        return [self.format(n) for n in self.reserve(db, count)]
+
+
+# Singleton instance
+emp_id_sequence = SequenceService()
@@ -1,24 +1,21 @@
-from sqlalchemy import create_engine, text
+import sys
+from app import database
+from app.services.migration_service import migration_runner
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+db = database.connect()
 
 def run_migration():
     print("Migrating Database...")
-    with engine.connect() as conn:
-        try:
-            # Check if column exists, if not add it
-            # SQLite doesn't have IF NOT EXISTS for columns, easy way is just try/catch
-            conn.execute(text("ALTER TABLE generated_letters ADD COLUMN content TEXT"))
-            print("Successfully added 'content' column.")
-        except Exception as e:
-            if "duplicate column name" in str(e):
-                print("'content' column already exists.")
-            else:
-                print(f"Error: {e}")
-                
-        # Also fix file_path nullable if needed, but SQLite is loose on this
+    migration_runner.run(db)
     print("Migration Complete.")
 
+def show_status():
+    for m in migration_runner.status(db):
+        print(f"{m['version']:>3}  {m['name']:32} {m['status']:8} {m['processed']} documents")
+
 if __name__ == "__main__":
-    run_migration()
+    # python migrate_db.py [status]
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        show_status()
+    else:
+        run_migration()
@@ -0,0 +1,97 @@
+"""
+EmailService's Brevo client against a local stub of the /v3/smtp/email endpoint:
+the keep-alive session must reuse one connection across sends, and batch sends
+must map the response's messageIds back to recipients in order.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+import pytest
+
+from app.services.email_service import EmailService
+
+
+class BrevoStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real API
+    requests = [] # (client port, headers, payload)
+    status = 201
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        BrevoStub.requests.append((self.client_address[1], dict(self.headers), payload))
+
+        if BrevoStub.status != 201:
+            body = {"code": "invalid_parameter", "message": "stub error"}
+        elif "messageVersions" in payload:
+            body = {"messageIds": [f"<{v['to'][0]['email']}>" for v in payload["messageVersions"]]}
+        else:
+            body = {"messageId": f"<{payload['to'][0]['email']}>"}
+
+        data = json.dumps(body).encode()
+        self.send_response(BrevoStub.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def brevo(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BrevoStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    BrevoStub.requests = []
+    BrevoStub.status = 201
+
+    monkeypatch.setenv("BREVO_API_KEY", "test-key")
+    monkeypatch.setenv("BREVO_SENDER_EMAIL", "hr@example.com")
+    monkeypatch.setenv("BREVO_API_URL", f"http://127.0.0.1:{server.server_port}/v3/smtp/email")
+    service = EmailService()
+    yield service
+
+    service.brevo_session.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_sends_reuse_one_connection(brevo):
+    for i in range(3):
+        result = brevo.send_offer_letter(f"p{i}@example.com", f"Partner {i}", pdf_content=b"%PDF-1.7 stub",
+                                         email_body="Hello", subject="Agreement")
+        assert result["status"] == "success"
+
+    ports = {port for port, _, _ in BrevoStub.requests}
+    assert len(BrevoStub.requests) == 3
+    assert len(ports) == 1 # same client socket for every request
+
+    _, headers, payload = BrevoStub.requests[0]
+    assert headers["api-key"] == "test-key"
+    assert payload["to"] == [{"email": "p0@example.com", "name": "Partner 0"}]
+    assert payload["attachment"][0] == {"name": "Agreement_Partner_0.pdf", "content": "JVBERi0xLjcgc3R1Yg=="}
+
+
+def test_batch_maps_message_ids_to_recipients(brevo):
+    brevo.BREVO_BATCH_LIMIT = 2 # force two API calls
+    recipients = [{"email": f"r{i}@example.com", "name": f"R{i}"} for i in range(3)]
+
+    results = brevo.send_batch(recipients, "Hi {{ params.name }}", "Dear {{ params.name }}")
+
+    assert [r["email"] for r in results] == ["r0@example.com", "r1@example.com", "r2@example.com"]
+    assert [r["status"] for r in results] == ["success"] * 3
+    assert [r["message_id"] for r in results] == ["<r0@example.com>", "<r1@example.com>", "<r2@example.com>"]
+
+    assert [len(p["messageVersions"]) for _, _, p in BrevoStub.requests] == [2, 1]
+    assert BrevoStub.requests[0][2]["messageVersions"][1]["params"] == {"name": "R1"}
+    assert len({port for port, _, _ in BrevoStub.requests}) == 1
+
+
+def test_batch_error_fails_every_recipient_in_the_call(brevo):
+    BrevoStub.status = 400
+    results = brevo.send_batch([{"email": "a@example.com"}, {"email": "b@example.com"}], "Hi", "Body")
+
+    assert [r["status"] for r in results] == ["error", "error"]
+    assert all("stub error" in r["message"] for r in results)
@@ -0,0 +1,73 @@
+"""
+AgreementDocxBuilder against HTML as the letter editor's contentEditable writes it:
+<div> lines, <div><br></div> blank lines and formatting carried on span styles.
+"""
+import io
+
+import pytest
+
+docx = pytest.importorskip("docx")
+
+from app.services.docx_service import build_docx
+
+
+def paragraphs(html):
+    document = docx.Document(io.BytesIO(build_docx(html)))
+    return [p for p in document.paragraphs if p.text or not p.runs]
+
+
+def runs(paragraph):
+    return [(r.text, bool(r.bold), bool(r.italic), bool(r.underline)) for r in paragraph.runs]
+
+
+def test_div_lines_become_paragraphs():
+    html = (
+        '<p>Dear Partner,</p>'
+        '<div>Line A</div><div>Line B</div>'
+        '<div><br></div>'
+        '<div style="text-align: right">Regards</div>'
+    )
+    result = paragraphs(html)
+
+    assert [p.text for p in result] == ["Dear Partner,", "Line A", "Line B", "", "Regards"]
+    assert result[4].alignment == docx.enum.text.WD_ALIGN_PARAGRAPH.RIGHT
+
+
+def test_wrapper_div_keeps_blocks_and_tail_text_apart():
+    result = paragraphs('<div class="letter"><h2>Terms</h2><p>First</p>Added after</div>')
+
+    assert [p.text for p in result] == ["Terms", "First", "Added after"]
+    assert runs(result[0]) == [("Terms", True, False, False)]
+
+
+def test_inline_styles_format_runs():
+    html = (
+        '<div>Plain <span style="font-weight: bold;">bold</span> '
+        '<span style="font-weight:700">heavy</span> '
+        '<span style="text-decoration: underline">under</span> '
+        '<span style="font-style: italic">slanted</span></div>'
+        '<div><b>Kept <span style="font-weight: normal">unbolded</span></b></div>'
+    )
+    first, second = paragraphs(html)
+
+    assert runs(first) == [
+        ("Plain ", False, False, False),
+        ("bold", True, False, False),
+        (" ", False, False, False),
+        ("heavy", True, False, False),
+        (" ", False, False, False),
+        ("under", False, False, True),
+        (" ", False, False, False),
+        ("slanted", False, True, False),
+    ]
+    assert runs(second) == [("Kept ", True, False, False), ("unbolded", False, False, False)]
+
+
+def test_div_lines_inside_table_cells():
+    html = '<table><tr><td><div><b>For the Company</b></div><div>Name</div></td></tr></table>'
+    document = docx.Document(io.BytesIO(build_docx(html)))
+    cell = document.tables[0].rows[0].cells[0]
+
+    assert paragraphs(html) == [] # cell text stays in the table
+    assert [p.text for p in cell.paragraphs] == ["For the Company", "Name"]
+    assert runs(cell.paragraphs[0]) == [("For the Company", True, False, False)]
@@ -142,50 +142,43 @@ function App() {
     setIsBulkSending(true);
     setBulkProgress(`Starting...`);
     const ids = Array.from(selectedIds);
-    let successCount = 0;
-    for (let i = 0; i < ids.length; i++) {
-      const empId = ids[i];
-      const emp = employees.find(e => e.id === empId);
-      if (!emp) continue;
-      setBulkProgress(`Sending to ${emp.name} (${i + 1}/${ids.length})...`);
-      try {
-        const genRes = await fetch(`${API_URL}/letters/generate`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
-            employee_id: emp.id,
-            letter_type: "Agreement",
-            tone: "Professional",
-            company_name: companyName
-          })
-        });
-        const genData = await genRes.json();
-        const content = genData.content;
-
-        // Use the selectedTemplate instead of default PDF generator
-        const contentWithoutHeader = content.replace(/<div style="text-align: center; border-bottom: 2px solid #0056b3;[\s\S]*?<\/div>/i, '');
-        const { generatePdfWithTemplate } = await import('./utils/pdfTemplateGenerator');
-        const pdfBase64 = await generatePdfWithTemplate(contentWithoutHeader, selectedTemplate);
-
-        const subject = `Agreement - ${emp.name}`;
-        await fetch(`${API_URL}/email/send`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
-            employee_id: emp.id,
-            letter_content: content,
-            pdf_base64: pdfBase64,
-            subject: subject,
-            company_name: companyName,
-            custom_message: `Dear ${emp.name},\n\nWe are pleased to align on an agreement with ${companyName}.\n\nPlease find your agreement document attached.\n\nRegards,\nTeam`
-          })
-        });
-        successCount++;
-      } catch (err) { console.error(`Failed for ${emp.name}`, err); }
+    try {
+      // The backend generates and renders every agreement in its own worker pool and queues
+      // the emails in its outbox, so the run survives this tab closing. We only poll here.
+      const res = await fetch(`${API_URL}/letters/bulk`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          employee_ids: ids,
+          template: selectedTemplate,
+          letter_type: "Agreement",
+          company_name: companyName
+        })
+      });
+      if (!res.ok) throw new Error(`Failed to start bulk send (${res.status})`);
+      const { job_id } = await res.json();
+
+      let job = null;
+      do {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const jobRes = await fetch(`${API_URL}/jobs/${job_id}`);
+        if (!jobRes.ok) throw new Error(`Lost track of the bulk send (${jobRes.status})`);
+        job = await jobRes.json();
+        setBulkProgress(`Sending... (${job.processed}/${job.total})`);
+      } while (job.status === 'queued' || job.status === 'running');
+
+      if (job.status !== 'completed') {
+        throw new Error(job.error || `Bulk send ${job.status} after ${job.processed}/${job.total}`);
+      }
+      job.items.filter(item => item.status === 'error')
+        .forEach(item => console.error(`Failed for ${item.key}`, item.message));
+      alert(`Bulk Send Complete! Queued ${job.succeeded}/${job.total} emails for delivery.`);
+    } catch (err) {
+      console.error("Bulk send failed", err);
+      alert("Bulk Send Error: " + err.message);
     }
     setIsBulkSending(false);
     setBulkProgress("");
-    alert(`Bulk Send Complete! Sent ${successCount}/${ids.length} emails.`);
     setSelectedIds(new Set());
     fetchEmployees();
   };
@@ -348,24 +348,28 @@ const LetterModal = ({ employee, onClose, onSuccess }) => {
 
         try {
             const subject = `${letterType} - ${employee.name}`;
-            const res = await fetch(`${API_URL}/email/send`, {
+            // Send the PDF as a binary part rather than a base64 string inside JSON
+            const form = new FormData();
+            form.append('employee_id', employee.id);
+            form.append('letter_content', generatedContent);
+            if (emailBody) form.append('custom_message', emailBody);
+            form.append('subject', subject);
+            form.append('company_name', companyName);
+            if (pdfUrl) {
+                const pdfBlob = await (await fetch(pdfUrl)).blob();
+                form.append('pdf', pdfBlob, 'Agreement.pdf');
+            }
+
+            const res = await fetch(`${API_URL}/email/send-file`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    employee_id: employee.id,
-                    letter_content: generatedContent,
-                    pdf_base64: pdfUrl,
-                    custom_message: emailBody,
-                    subject: subject,
-                    company_name: companyName
-                })
+                body: form
             });
 
             const data = await res.json();
             if (data.status === 'error') throw new Error(data.message);
 
-            alert("Email Sent Successfully! 🚀");
-            btn.innerText = 'Sent ✅';
+            alert("Email queued for delivery! 🚀");
+            btn.innerText = 'Queued ✅';
             if (onSuccess) onSuccess();
 
         } catch (err) {
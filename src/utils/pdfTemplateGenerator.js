@@ -10,6 +10,35 @@
  * through a section heading). This eliminates all jsPDF autoPaging bugs.
  */
 
+import { API_URL } from '../config';
+
+// Layout metrics the backend measured from uploaded letterheads, by template URL
+const analyzedLayouts = {};
+
+const fetchTemplateLayout = async (templateUrl) => {
+    if (!analyzedLayouts[templateUrl]) {
+        try {
+            const res = await fetch(`${API_URL}/upload/template-layout?url=${encodeURIComponent(templateUrl)}`);
+            if (!res.ok) return null;
+            const layout = await res.json();
+            analyzedLayouts[templateUrl] = {
+                pageW: layout.pageW, pageH: layout.pageH,
+                marginTop: layout.marginTop, marginBottom: layout.marginBottom, marginLR: layout.marginLR
+            };
+        } catch (e) {
+            console.warn('[PDF GEN] Could not load template layout:', e);
+            return null;
+        }
+    }
+    return analyzedLayouts[templateUrl];
+};
+
+// Uploaded templates live under content-hashed /assets/ names: the API serves them
+// as immutable, so the browser cache can be used. Fixed names may be replaced in place.
+const templateFetchUrl = (templateUrl) => templateUrl.startsWith('/assets/')
+    ? `${API_URL}${templateUrl}`
+    : `${templateUrl}?t=${Date.now()}`;
+
 export const generatePdfWithTemplate = async (htmlContent, templateUrl = '/Arah_Template.pdf') => {
     try {
         const { PDFDocument } = await import('pdf-lib');
@@ -39,7 +68,7 @@ export const generatePdfWithTemplate = async (htmlContent, templateUrl = '/Arah_
             },
         };
 
-        const cfg = TEMPLATE_CONFIG[templateUrl] || {
+        const cfg = TEMPLATE_CONFIG[templateUrl] || (await fetchTemplateLayout(templateUrl)) || {
             pageW: 612, pageH: 792, marginTop: 110, marginBottom: 60, marginLR: 50
         };
 
@@ -238,7 +267,7 @@ export const generatePdfWithTemplate = async (htmlContent, templateUrl = '/Arah_
         let templatePage = null;
 
         if (isImage) {
-            const imgRes = await fetch(`${templateUrl}?t=${Date.now()}`);
+            const imgRes = await fetch(templateFetchUrl(templateUrl));
             const imageBytes = await imgRes.arrayBuffer();
             templateImage = templateUrl.toLowerCase().endsWith('.png')
                 ? await finalDoc.embedPng(imageBytes)
@@ -247,7 +276,7 @@ export const generatePdfWithTemplate = async (htmlContent, templateUrl = '/Arah_
                     catch { return await finalDoc.embedPng(imageBytes); }
                 })();
         } else {
-            const templateRes = await fetch(`${templateUrl}?t=${Date.now()}`);
+            const templateRes = await fetch(templateFetchUrl(templateUrl));
             const templatePdfBytes = await templateRes.arrayBuffer();
             templatePdfDoc = await PDFDocument.load(templatePdfBytes);
             const [embeddedPage] = await finalDoc.embedPdf(templatePdfDoc, [0]);